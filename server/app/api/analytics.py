@@ -0,0 +1,81 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Iterable, List, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+from schemas.users import User
+from schemas.workouts import Workout, Exercise, Set, Subset, ExerciseName, normalize_name
+from schemas.stats import UserStats, PersonalRecord
+from models.analytics import ExerciseProgress, WorkoutProgress, UserStatsRead, PersonalRecordRead
+from rollups import NewRecord
+from api.changes import record_change
+router = APIRouter()
+
+
+def progress_query(user_id: int, exercise: str):
+    # Aggregated in the database, one row per workout. Walks the (user_id, id) and foreign key indexes
+    return (
+        select(
+            Workout.id.label("workout_id"),
+            func.count(func.distinct(Set.id)).label("sets"),
+            func.sum(Subset.reps).label("reps"),
+            func.sum(Subset.reps * Subset.weight).label("volume"),
+            func.max(Subset.weight).label("top_weight"),
+            func.max(Subset.weight * (1 + Subset.reps / 30.0)).label("estimated_1rm"),
+        )
+        .select_from(Workout)
+        .join(Exercise, Exercise.workout_id == Workout.id)
+        .join(Set, Set.exercise_id == Exercise.id)
+        .join(Subset, Subset.set_id == Set.id)
+        .join(ExerciseName, ExerciseName.id == Set.exercise_name_id)
+        .where(Workout.user_id == user_id, ExerciseName.normalized == normalize_name(exercise))
+        .group_by(Workout.id)
+        .order_by(Workout.id)
+    )
+
+
+@router.get("/users/{id}/progress", response_model=ExerciseProgress)
+async def get_progress(id: int, exercise: str, db: AsyncSession = Depends(get_db)):
+    if not await db.get(User, id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    rows = (await db.execute(progress_query(id, exercise))).mappings().all()
+    return ExerciseProgress(
+        user_id=id,
+        exercise=exercise,
+        workouts=[WorkoutProgress.model_validate(dict(row)) for row in rows]
+    )
+
+
+@router.get("/users/{id}/stats", response_model=UserStatsRead)
+async def get_stats(id: int, db: AsyncSession = Depends(get_db)):
+    # Primary key reads of the rollups, no joins over the workout tables
+    stats = await db.get(UserStats, id)
+    if stats is None and not await db.get(User, id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    records = (await db.execute(
+        select(ExerciseName.name.label("exercise_name"), PersonalRecord.top_weight, PersonalRecord.estimated_1rm)
+        .join(ExerciseName, ExerciseName.id == PersonalRecord.exercise_name_id)
+        .where(PersonalRecord.user_id == id)
+        .order_by(ExerciseName.normalized)
+    )).all()
+    # No rollup row yet means nothing has been logged
+    result = UserStatsRead.model_validate(stats) if stats else UserStatsRead(user_id=id)
+    result.records = [PersonalRecordRead.model_validate(record) for record in records]
+    return result
+
+
+async def record_personal_records(db: AsyncSession, records: Iterable[NewRecord]) -> List[Tuple[str, str]]:
+    """Log new personal records (returned by rollups.apply_rollup) as events on users:{id}, publish after commit"""
+    events = []
+    for record in records:
+        resource = f"users:{record.user_id}"
+        payload = await record_change(db, [resource], "personal_record", {
+            "user_id": record.user_id,
+            "exercise_name": record.exercise_name,
+            "top_weight": record.top_weight,
+            "estimated_1rm": record.estimated_1rm,
+        })
+        events.append((resource, payload))
+    return events
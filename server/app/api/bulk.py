@@ -0,0 +1,196 @@
+from typing import Any, AsyncIterator, Dict, List, Sequence, Type
+from fastapi import HTTPException, Request
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+import csv
+import io
+import json
+from schemas.workouts import Workout, Exercise, Set, Subset, ExerciseName
+from schemas.users import User
+from models.workouts import WorkoutCreate
+from api.catalog import resolve_names
+
+BATCH_SIZE = 500
+EXPORT_CHUNK = 1000
+
+workout_list = TypeAdapter(List[WorkoutCreate])
+
+
+def validation_error(error: ValidationError, *location: int) -> HTTPException:
+    return HTTPException(status_code=422, detail=[
+        {"loc": ["body", *location, *e["loc"]], "msg": e["msg"], "type": e["type"]}
+        for e in error.errors(include_url=False, include_context=False)
+    ])
+
+
+async def read_workouts(request: Request) -> AsyncIterator[List[WorkoutCreate]]:
+    """Yield validated workouts in batches, from a JSON array or an NDJSON stream"""
+    if "ndjson" not in request.headers.get("content-type", ""):
+        try:
+            workouts = workout_list.validate_json(await request.body())
+        except ValidationError as e:
+            raise validation_error(e)
+        for start in range(0, len(workouts), BATCH_SIZE):
+            yield workouts[start:start + BATCH_SIZE]
+        return
+
+    batch: List[WorkoutCreate] = []
+    buffer = b""
+    line_number = 0
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                batch.append(WorkoutCreate.model_validate_json(line))
+            except ValidationError as e:
+                raise validation_error(e, line_number)
+
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = []
+
+    if buffer.strip():
+        try:
+            batch.append(WorkoutCreate.model_validate_json(buffer))
+        except ValidationError as e:
+            raise validation_error(e, line_number + 1)
+
+    if batch:
+        yield batch
+
+
+async def insert_returning_ids(db: AsyncSession, model: Type[Workout | Exercise | Set], rows: List[Dict]) -> Sequence[int]:
+    # One multi-row INSERT ... RETURNING per batch, ids come back in parameter order
+    if not rows:
+        return []
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return (await db.scalars(statement, rows)).all()
+
+
+async def check_users(db: AsyncSession, workouts: List[WorkoutCreate]) -> None:
+    # One lookup per batch, rather than a foreign key error halfway through the inserts
+    user_ids = {w.user_id for w in workouts}
+    found = set(await db.scalars(select(User.id).where(User.id.in_(user_ids))))
+    missing = sorted(user_ids - found)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {', '.join(map(str, missing))}")
+
+
+async def insert_workouts(db: AsyncSession, workouts: List[WorkoutCreate]) -> Sequence[int]:
+    """Insert whole workout trees level by level instead of row by row through the unit of work"""
+    await check_users(db, workouts)
+    workout_ids = await insert_returning_ids(db, Workout, [{"user_id": w.user_id} for w in workouts])
+
+    exercises = [(workout_id, ex) for workout_id, w in zip(workout_ids, workouts) for ex in w.exercises]
+    exercise_ids = await insert_returning_ids(db, Exercise, [
+        {"workout_id": workout_id, "exercise_number": ex.exercise_number}
+        for workout_id, ex in exercises
+    ])
+
+    sets = [(exercise_id, s) for exercise_id, (_, ex) in zip(exercise_ids, exercises) for s in ex.sets]
+    names = await resolve_names(db, [s.exercise_name for _, s in sets])
+    set_ids = await insert_returning_ids(db, Set, [
+        {"exercise_id": exercise_id, "exercise_name_id": names[s.exercise_name].id, "set_number": s.set_number}
+        for exercise_id, s in sets
+    ])
+
+    subsets = [
+        {"set_id": set_id, "reps": ss.reps, "weight": ss.weight, "subset_number": ss.subset_number}
+        for set_id, (_, s) in zip(set_ids, sets) for ss in s.subsets
+    ]
+    if subsets:
+        await db.execute(insert(Subset), subsets)
+
+    return workout_ids
+
+
+# ---------- Export ----------
+EXPORT_COLUMNS = [
+    "workout_id", "user_id",
+    "exercise_id", "exercise_number",
+    "set_id", "set_number", "exercise_name",
+    "subset_id", "subset_number", "reps", "weight",
+]
+
+def export_query(user_id: int):
+    # One row per subset, outer joined so empty exercises and sets are kept
+    return (
+        select(
+            Workout.id, Workout.user_id,
+            Exercise.id, Exercise.exercise_number,
+            Set.id, Set.set_number, ExerciseName.name,
+            Subset.id, Subset.subset_number, Subset.reps, Subset.weight,
+        )
+        .select_from(Workout)
+        .outerjoin(Exercise, Exercise.workout_id == Workout.id)
+        .outerjoin(Set, Set.exercise_id == Exercise.id)
+        .outerjoin(ExerciseName, ExerciseName.id == Set.exercise_name_id)
+        .outerjoin(Subset, Subset.set_id == Set.id)
+        .where(Workout.user_id == user_id)
+        .order_by(Workout.id, Exercise.exercise_number, Exercise.id, Set.set_number, Set.id, Subset.subset_number, Subset.id)
+        .execution_options(yield_per=EXPORT_CHUNK)
+    )
+
+
+async def export_rows(user_id: int) -> AsyncIterator[Sequence[Any]]:
+    # Own session: the export outlives the request handler, and rows come through a server-side cursor
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(export_query(user_id))
+        async for row in result:
+            yield row
+
+
+async def export_ndjson(user_id: int) -> AsyncIterator[str]:
+    """One workout per line in the WorkoutRead shape, only a single workout is held in memory"""
+    workout: Dict[str, Any] | None = None
+
+    async for row in export_rows(user_id):
+        workout_id, user_id, exercise_id, exercise_number, set_id, set_number, exercise_name, subset_id, subset_number, reps, weight = row
+
+        if workout is None or workout["id"] != workout_id:
+            if workout is not None:
+                yield json.dumps(workout) + "\n"
+            workout = {"id": workout_id, "user_id": user_id, "exercises": []}
+
+        if exercise_id is None:
+            continue
+        exercises = workout["exercises"]
+        if not exercises or exercises[-1]["id"] != exercise_id:
+            exercises.append({"id": exercise_id, "workout_id": workout_id, "exercise_number": exercise_number, "sets": []})
+
+        if set_id is None:
+            continue
+        sets = exercises[-1]["sets"]
+        if not sets or sets[-1]["id"] != set_id:
+            sets.append({"id": set_id, "exercise_id": exercise_id, "exercise_name": exercise_name, "set_number": set_number, "subsets": []})
+
+        if subset_id is None:
+            continue
+        sets[-1]["subsets"].append({"id": subset_id, "set_id": set_id, "reps": reps, "weight": weight, "subset_number": subset_number})
+
+    if workout is not None:
+        yield json.dumps(workout) + "\n"
+
+
+async def export_csv(user_id: int) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    rows = 0
+    async for row in export_rows(user_id):
+        writer.writerow(row)
+        rows += 1
+        if rows % EXPORT_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
@@ -0,0 +1,107 @@
+from typing import Awaitable, Callable, Dict, Iterable, Tuple
+from collections import OrderedDict
+from fastapi import Request, Response
+import hashlib
+import os
+import time
+
+
+def body_etag(body: str) -> str:
+    # Derived from the content, so every worker (and every restart) issues the same ETag for it
+    return '"' + hashlib.blake2b(body.encode(), digest_size=12).hexdigest() + '"'
+
+
+class ResponseCache:
+    """
+    In-process LRU of serialized responses keyed by resource ("workouts:42"), with a TTL as a backstop.
+    Writes invalidate the resource and every ancestor, the same chain that receives the broadcast.
+    Each body is kept with its ETag, hashed once when stored.
+    """
+    def __init__(self, max_size: int = 10_000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[str, Tuple[float, str, str]] = OrderedDict()  # key -> (expires, body, etag)
+
+        # Bumped on every invalidation, a load that started before a write is not stored
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Tuple[str, str] | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(self, key: str, body: str, etag: str, epoch: int) -> None:
+        if epoch != self.epoch:
+            return
+
+        self.entries[key] = (time.monotonic() + self.ttl, body, etag)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[str | None]]) -> Tuple[str, str] | None:
+        """(body, etag) for key, loaded and stored on a miss. None if load finds nothing"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        epoch = self.epoch
+        body = await load()
+        if body is None:
+            return None
+        etag = body_etag(body)
+        self.put(key, body, etag, epoch)
+        return body, etag
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        self.epoch += 1
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+)
+
+
+def resources_changed(resources: Iterable[str]) -> None:
+    response_cache.invalidate(resources)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+def conditional(request: Request, body: str, etag: str | None = None) -> Response:
+    """The JSON body, or a 304 if the client already has it"""
+    headers = {"ETag": etag or body_etag(body), "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,134 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import os
+import time
+from database import get_db, dialect_inserts
+from schemas.workouts import ExerciseName, normalize_name
+from models.workouts import ExerciseNameRead
+router = APIRouter()
+
+# Names added by other workers are picked up by an incremental reload at most this often
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "5"))
+
+
+class TrieNode:
+    __slots__ = ("children", "entry")
+
+    def __init__(self):
+        self.children: Dict[str, TrieNode] = {}
+        self.entry: Tuple[int, str] | None = None
+
+
+class NameIndex:
+    """In-memory prefix index over the exercise name catalog, keyed by normalized name"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.root = TrieNode()
+        self.names: Dict[int, str] = {}
+        self.last_id = 0
+        self.loaded_at = float("-inf")
+
+    def add(self, id: int, name: str) -> None:
+        if id in self.names:
+            return
+        self.names[id] = name
+        key = normalize_name(name)
+        if not key:
+            return  # blank names are never suggested
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, TrieNode())
+        node.entry = (id, name)
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[int, str]]:
+        key = normalize_name(prefix)
+        if key and prefix[-1].isspace():
+            key += " "  # "bench " should not match "benchmark"
+
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        # Depth first in character order, so matches come out alphabetically
+        matches = []
+        stack = [node]
+        while stack and len(matches) < limit:
+            node = stack.pop()
+            if node.entry is not None:
+                matches.append(node.entry)
+            stack.extend(node.children[char] for char in sorted(node.children, reverse=True))
+        return matches
+
+    async def refresh(self, db: AsyncSession) -> None:
+        if time.monotonic() - self.loaded_at < CATALOG_REFRESH_SECONDS:
+            return
+        rows = await db.execute(
+            select(ExerciseName.id, ExerciseName.name).where(ExerciseName.id > self.last_id).order_by(ExerciseName.id)
+        )
+        # The watermark only moves here: entries added locally don't hide lower ids from other workers
+        for id, name in rows:
+            self.add(id, name)
+            self.last_id = id
+        self.loaded_at = time.monotonic()
+
+name_index = NameIndex()
+
+# Entries resolved in a transaction may be ones it created, which a rollback takes back (and SQLite
+# hands their ids out again). Like parent links, they only reach the shared index once it commits
+def pending_names(session: Session) -> Dict[int, str]:
+    return session.info.setdefault("pending_names", {})
+
+@event.listens_for(Session, "after_commit")
+def index_pending_names(session: Session) -> None:
+    for id, name in session.info.pop("pending_names", {}).items():
+        name_index.add(id, name)
+
+@event.listens_for(Session, "after_soft_rollback")
+def drop_pending_names(session: Session, previous_transaction) -> None:
+    session.info.pop("pending_names", None)
+
+
+async def resolve_names(db: AsyncSession, names: Sequence[str]) -> Dict[str, ExerciseName]:
+    """Map each name to its catalog entry, creating missing entries in the current transaction"""
+    wanted = {normalize_name(name): name for name in names}
+    if not wanted:
+        return {}
+    entries = {
+        entry.normalized: entry
+        for entry in await db.scalars(select(ExerciseName).where(ExerciseName.normalized.in_(wanted)))
+    }
+
+    missing = [key for key in wanted if key not in entries]
+    if missing:
+        # A concurrent request may create the same entry, the unique index settles the race
+        insert = dialect_inserts[db.get_bind().dialect.name](ExerciseName)
+        await db.execute(
+            insert.values([{"name": " ".join(wanted[key].split()), "normalized": key} for key in missing])
+            .on_conflict_do_nothing(index_elements=[ExerciseName.normalized])
+        )
+        for entry in await db.scalars(select(ExerciseName).where(ExerciseName.normalized.in_(missing))):
+            entries[entry.normalized] = entry
+
+    pending = pending_names(db.sync_session)
+    for entry in entries.values():
+        pending[entry.id] = entry.name
+    return {name: entries[normalize_name(name)] for name in names}
+
+
+@router.get("/exercise-names", response_model=List[ExerciseNameRead])
+async def search_exercise_names(
+    prefix: str = "",
+    limit: int = Query(default=10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    # Served from the trie, the database is only read for names created since the last refresh
+    await name_index.refresh(db)
+    return [ExerciseNameRead(id=id, name=name) for id, name in name_index.search(prefix, limit)]
@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from typing import Any, List, Tuple
+from pydantic import BaseModel
+from sqlalchemy import Sequence, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import timedelta
+import json
+import os
+from database import get_db
+from schemas.changes import Change, ChangeResource, ChangeRetention
+from ws_manager import websocket_manager, encode_event, with_resource
+router = APIRouter()
+
+MAX_CHANGES = 500
+
+# Sequence numbers are handed out when a change is recorded but become visible at commit, so a
+# lower number can show up after a higher one. Readers stop short of changes younger than this;
+# writers record their changes last, right before committing, to stay well inside it
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", "1"))
+changes_sequence = Sequence("Changes_seq_seq")  # behind the SERIAL column on Postgres
+
+
+async def record_change(db: AsyncSession, resources: List[str], event_type: str, data: BaseModel | Any) -> str:
+    """Number an event and log it in the current transaction. Returns the payload to broadcast after commit"""
+    if db.get_bind().dialect.name == "postgresql":
+        seq = (await db.execute(select(changes_sequence.next_value()))).scalar_one()
+        # now() is the transaction start on Postgres, the settle window is measured from here
+        created_at = func.clock_timestamp()
+    else:
+        # What the rowid would be, the transaction already holds SQLite's write lock
+        seq = (await db.execute(select(func.coalesce(func.max(Change.seq), 0) + 1))).scalar_one()
+        created_at = func.now()
+    payload = encode_event(event_type, data, seq=seq)
+    await db.execute(insert(Change).values(seq=seq, event_type=event_type, payload=payload, created_at=created_at))
+    await db.execute(insert(ChangeResource), [{"resource": resource, "seq": seq} for resource in resources])
+    return payload
+
+
+async def settled_seq(db: AsyncSession) -> int | None:
+    # Highest seq no transaction still in flight can undercut. SQLite serializes writers, so
+    # numbers commit in order there and everything visible is settled
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    return (await db.execute(
+        select(Change.seq)
+        .where(Change.created_at < func.clock_timestamp() - timedelta(seconds=CHANGES_SETTLE_SECONDS))
+        .order_by(Change.seq.desc())
+        .limit(1)
+    )).scalar() or 0
+
+
+async def publish(events: List[Tuple[str, str]]) -> None:
+    # (resource, payload) pairs from record_change, once the transaction has committed
+    for resource, payload in events:
+        await websocket_manager.broadcast(resource=resource, data=payload)
+
+
+@router.get("/changes")
+async def get_changes(
+    resource: str,
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=MAX_CHANGES, ge=1, le=MAX_CHANGES),
+    db: AsyncSession = Depends(get_db)
+):
+    # Events on resource with seq > since, oldest first. Served from the broadcast history when it
+    # reaches back far enough, otherwise from the change log. Subscribe before fetching, so
+    # nothing falls between the delta and live delivery. A since the pruned log no longer reaches
+    # answers 410, the client reloads the resource and continues from the latest seq it sees
+    settled = await settled_seq(db)
+    events: List[Tuple[int, str]] | None = websocket_manager.history.since(resource, since)
+    if events is None or len(events) > limit:
+        pruned = (await db.execute(select(ChangeRetention.pruned_through))).scalar() or 0
+        if since < pruned:
+            raise HTTPException(status_code=410, detail=f"Changes up to {pruned} were pruned, reload the resource")
+        events = list((await db.execute(
+            select(Change.seq, Change.payload)
+            .join(ChangeResource, ChangeResource.seq == Change.seq)
+            .where(ChangeResource.resource == resource, ChangeResource.seq > since)
+            .order_by(ChangeResource.seq)
+            .limit(limit + 1)
+        )).all())
+
+    more = len(events) > limit
+    events = events[:limit]
+    if settled is not None and events and events[-1][0] > settled:
+        # Served again once settled, meanwhile live delivery covers subscribed clients
+        events = [entry for entry in events if entry[0] <= settled]
+        more = True
+    latest = events[-1][0] if events else since
+
+    # Payloads are already encoded, the body is assembled around them
+    frames = ",".join(with_resource(payload, resource) for _, payload in events)
+    body = f'{{"resource":{json.dumps(resource)},"since":{since},"latest":{latest},"more":{json.dumps(more)},"events":[{frames}]}}'
+    return Response(content=body, media_type="application/json")
@@ -1,30 +1,48 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Literal
+import json
 from database import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from schemas.users import User
 from models.users import UserCreate
-from ws_manager import websocket_manager  
+from ws_manager import websocket_manager
+from api.changes import record_change
+from api.bulk import export_ndjson, export_csv
+from api.cache import resources_changed, conditional
 router = APIRouter()
 
 @router.get("/users")
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    return users
+async def get_users(request: Request, db: AsyncSession = Depends(get_db)):
+    users = (await db.scalars(select(User).order_by(User.id))).all()
+    return conditional(request, json.dumps(jsonable_encoder(users), separators=(",", ":")))
 
 
 @router.post("/users")
-async def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     new_user = User(name=user_data.name)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.flush()
+    payload = await record_change(db, ["users"], "user_created", jsonable_encoder(new_user))
+    await db.commit()
+    resources_changed(["users"])
 
-    await websocket_manager.broadcast(
-        resource="users", 
-        data={
-            "type":"user_created",
-            "data": new_user.__dict__
-      }
-    )
+    await websocket_manager.broadcast(resource="users", data=payload)
 
     return new_user
+
+
+@router.get("/users/{id}/export")
+async def export_workouts(id: int, format: Literal["ndjson", "csv"] = "ndjson", db: AsyncSession = Depends(get_db)):
+    if not await db.get(User, id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(id),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="workouts-{id}.csv"'}
+        )
+    return StreamingResponse(export_ndjson(id), media_type="application/x-ndjson")
@@ -1,13 +1,15 @@
 from typing import List, Tuple, Dict, Type
-from sqlalchemy.orm import Session
+from collections import OrderedDict
+from fastapi import HTTPException
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+import base64
 from schemas.workouts import Workout, Exercise, Set, Subset
 from schemas.users import User
 
 AnyModel = User | Workout | Exercise | Set | Subset
 
-def get_data(db: Session, id: int, model:AnyModel) -> AnyModel:
-    return db.get(model, id)
-
 model_map: Dict[str, Tuple[str,Type[AnyModel]]]= {
     "subsets": ("subset_id", Subset),
     "sets": ("set_id", Set),
@@ -22,24 +24,121 @@ parent_map = {
     "exercises": "workouts",
     "workouts": "users"
 }
+child_map = {parent: child for child, parent in parent_map.items()}
+
+# Resolved parent links are cached ("sets:3" -> "exercises:1"). A row moved to another parent or
+# deleted has its links forgotten, on every worker (see main.py)
+PARENT_CACHE_SIZE = 100_000
+parent_cache: OrderedDict[str, str] = OrderedDict()
+
+def cache_parent(child: str, parent: str) -> None:
+    parent_cache[child] = parent
+    parent_cache.move_to_end(child)
+    if len(parent_cache) > PARENT_CACHE_SIZE:
+        parent_cache.popitem(last=False)
+
+def clear_parent_cache() -> None:
+    parent_cache.clear()
+
+def forget_parents(keys: List[str]) -> None:
+    for key in keys:
+        parent_cache.pop(key, None)
 
-def get_all_parents(db: Session, child_type: str, child_id: int, result: List[str]) -> List[str]: # ["exercise:1", "workout:1"]
+# Links resolved in a transaction may involve rows it created, which a rollback takes back (and
+# SQLite hands their ids out again). They only reach the shared cache once the transaction commits
+def pending_parents(session: Session) -> Dict[str, str]:
+    return session.info.setdefault("pending_parents", {})
 
-    result.append(f"{child_type}:{child_id}")
+@event.listens_for(Session, "after_commit")
+def cache_pending_parents(session: Session) -> None:
+    for child, parent in session.info.pop("pending_parents", {}).items():
+        cache_parent(child, parent)
 
-    if child_type not in parent_map:
+@event.listens_for(Session, "after_soft_rollback")
+def drop_pending_parents(session: Session, previous_transaction) -> None:
+    session.info.pop("pending_parents", None)
+
+async def get_all_parents(db: AsyncSession, child_type: str, child_id: int) -> List[str]: # ["exercises:1", "workouts:1", "users:1"]
+    result = [f"{child_type}:{child_id}"]
+    pending = pending_parents(db.sync_session)
+
+    while True:
+        if result[-1] in parent_cache:
+            parent_cache.move_to_end(result[-1])
+            result.append(parent_cache[result[-1]])
+        elif result[-1] in pending:
+            result.append(pending[result[-1]])
+        else:
+            break
+
+    first_type, first_id = result[-1].split(":")
+    if first_type not in parent_map:
         return result
 
-    parent_type = parent_map[child_type]
+    # Resolve the rest of the chain with a single joined query
+    types = [first_type]
+    while types[-1] in parent_map:
+        types.append(parent_map[types[-1]])
 
-    # get parent id
-    _, model = model_map[child_type]
-    relation, _ = model_map[parent_type]
-    response = get_data(db, child_id, model)
+    models = [model_map[t][1] for t in types[:-1]]
+    foreign_keys = [getattr(model_map[t][1], model_map[parent_map[t]][0]) for t in types[:-1]]
 
-    if response is None:
+    query = select(*foreign_keys).select_from(models[0])
+    for parent, foreign_key in zip(models[1:], foreign_keys):
+        query = query.join(parent, getattr(parent, "id") == foreign_key)
+
+    row = (await db.execute(query.where(getattr(models[0], "id") == int(first_id)))).one_or_none()
+    if row is None:
         raise RuntimeError("Unexpected error")
 
-    parent_id = getattr(response, relation)
+    for parent_type, parent_id in zip(types[1:], row):
+        parent = f"{parent_type}:{parent_id}"
+        pending[result[-1]] = parent
+        result.append(parent)
+
+    return result
+
+
+async def get_all_descendants(db: AsyncSession, parent_type: str, parent_id: int) -> List[str]: # ["sets:4", "subsets:9", ...]
+    types = []
+    current = parent_type
+    while current in child_map:
+        current = child_map[current]
+        types.append(current)
+    if not types:
+        return []
+
+    # One row per path down to the deepest level, outer joined so childless rows still show up
+    models = [model_map[t][1] for t in types]
+    query = select(*[getattr(model, "id") for model in models]).select_from(models[0])
+    for level, child in zip(types, models[1:]):
+        query = query.outerjoin(child, getattr(child, model_map[level][0]) == getattr(model_map[level][1], "id"))
+
+    rows = await db.execute(query.where(getattr(models[0], model_map[parent_type][0]) == parent_id))
+    keys = dict.fromkeys(f"{t}:{i}" for row in rows for t, i in zip(types, row) if i is not None)
+    return list(keys)
+
+
+# Tree loading: one batched "IN" query per level instead of a joined row per subset
+def workout_tree():
+    return selectinload(Workout.exercises).selectinload(Exercise.sets).selectinload(Set.subsets)
+
+def exercise_tree():
+    return selectinload(Exercise.sets).selectinload(Set.subsets)
+
+def set_tree():
+    return selectinload(Set.subsets)
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
 
-    return get_all_parents(db=db, child_type=parent_type, child_id=parent_id, result=result)
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, last_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        if prefix != "id":
+            raise ValueError(prefix)
+        return int(last_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
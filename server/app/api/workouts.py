@@ -1,64 +1,118 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel
+from typing import Any, Awaitable, Callable, Dict, List
 from database import get_db
-from sqlalchemy.orm import Session
-from schemas.workouts import Workout, Exercise, Set, Subset
-from models.workouts import WorkoutCreate, ExerciseCreate, SetCreate, SubsetCreate
-from sqlalchemy.orm import joinedload
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from schemas.workouts import Workout, Exercise, Set, Subset, ExerciseName
+from models.workouts import (
+    WorkoutCreate, ExerciseCreate, SetCreate, SubsetCreate,
+    WorkoutRead, ExerciseRead, SetRead, SubsetRead, WorkoutSummary, BulkImportResult,
+    WorkoutUpdate, ExerciseUpdate, SetUpdate, SubsetUpdate, WorkoutRow, ExerciseRow, SetRow, SubsetRow
+)
+from sqlalchemy.orm import selectinload
 from ws_manager import websocket_manager
-from api.util import get_all_parents
+from api.bulk import read_workouts, insert_workouts
+from api.cache import response_cache, resources_changed, conditional
+from api.util import (
+    get_all_parents, get_all_descendants, forget_parents, pending_parents, model_map, parent_map,
+    encode_cursor, decode_cursor, workout_tree, exercise_tree, set_tree
+)
+from api.analytics import record_personal_records
+from api.changes import record_change, publish
+from api.catalog import resolve_names
+from rollups import apply_rollup, remove_rollup, recompute_records
+import logging
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SUBSETS = 500
 
 
 
 # Get requests
 @router.get("/workouts")
-def get_workouts(db: Session = Depends(get_db)):
-    workouts = db.query(Workout).options(
-        joinedload(Workout.exercises).joinedload(Exercise.sets).joinedload(Set.subsets)
-    ).all()
-    return workouts
-
-@router.get("/workouts/{id}")
-def get_workout(id:int, db: Session = Depends(get_db)):
-    workout = db.query(Workout).options(
-        joinedload(Workout.exercises).joinedload(Exercise.sets).joinedload(Set.subsets)
-    ).filter(Workout.id == id).first()
+async def get_workouts(
+    response: Response,
+    user_id: int | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    summary: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    # Keyset pagination, newest first. The next page cursor is returned in the X-Next-Cursor header
+    query = select(Workout)
+    if user_id is not None:
+        query = query.where(Workout.user_id == user_id)
+    if cursor is not None:
+        query = query.where(Workout.id < decode_cursor(cursor))
 
-    if not workout:
+    if summary:
+        query = query.options(selectinload(Workout.exercises))
+    else:
+        query = query.options(workout_tree())
+
+    workouts = (await db.scalars(query.order_by(Workout.id.desc()).limit(limit + 1))).all()
+    if len(workouts) > limit:
+        workouts = workouts[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(getattr(workouts[-1], "id"))
+
+    if summary:
+        return [WorkoutSummary.model_validate(workout) for workout in workouts]
+    return [WorkoutRead.model_validate(workout) for workout in workouts]
+
+# Tree reads are served from the response cache, a hit never touches the database.
+# Clients revalidate with If-None-Match, the ETag is a hash of the body
+@router.get("/workouts/{id}", response_model=WorkoutRead)
+async def get_workout(id:int, request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        workout = await db.scalar(select(Workout).options(workout_tree()).where(Workout.id == id))
+        return WorkoutRead.model_validate(workout).model_dump_json() if workout else None
+
+    cached = await response_cache.get_or_load(f"workouts:{id}", load)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Workout not found")
-    return workout
+    return conditional(request, *cached)
 
-@router.get("/exercises/{id}")
-def get_exercise(id:int, db: Session = Depends(get_db)):
-    exercise = db.query(Exercise).options(
-        joinedload(Exercise.sets).joinedload(Set.subsets)
-    ).filter(Exercise.id == id).first()
+@router.get("/exercises/{id}", response_model=ExerciseRead)
+async def get_exercise(id:int, request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        exercise = await db.scalar(select(Exercise).options(exercise_tree()).where(Exercise.id == id))
+        return ExerciseRead.model_validate(exercise).model_dump_json() if exercise else None
 
-    if not exercise:
+    cached = await response_cache.get_or_load(f"exercises:{id}", load)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Exercise not found")
-    return exercise
+    return conditional(request, *cached)
 
-@router.get("/sets/{id}")
-def get_set(id:int, db: Session = Depends(get_db)):
-    exercise_set = db.query(Set).options(
-        joinedload(Set.subsets)
-    ).filter(Set.id == id).first()
+@router.get("/sets/{id}", response_model=SetRead)
+async def get_set(id:int, request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        exercise_set = await db.scalar(select(Set).options(set_tree()).where(Set.id == id))
+        return SetRead.model_validate(exercise_set).model_dump_json() if exercise_set else None
 
-    if not exercise_set:
+    cached = await response_cache.get_or_load(f"sets:{id}", load)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Set not found")
-    return exercise_set
+    return conditional(request, *cached)
 
-@router.get("/subsets/{id}")
-def get_subset(id:int, db: Session = Depends(get_db)):
-    subset = db.get(Subset,id)
+@router.get("/subsets/{id}", response_model=SubsetRead)
+async def get_subset(id:int, request: Request, db: AsyncSession = Depends(get_db)):
+    subset = await db.get(Subset,id)
     if not subset:
         raise HTTPException(status_code=404, detail="Subset not found")
-    return subset
+    return conditional(request, SubsetRead.model_validate(subset).model_dump_json())
 
 
 # Post requests
-@router.post("/workouts")
-async def create_workout(workout: WorkoutCreate, db: Session = Depends(get_db)):
+# The session keeps objects loaded after commit (expire_on_commit=False), so the new tree is
+# returned as built instead of being queried back. Parents are resolved and the user's rollups
+# updated in the same transaction, so no connection is held while broadcasting
+@router.post("/workouts", response_model=WorkoutRead)
+async def create_workout(workout: WorkoutCreate, db: AsyncSession = Depends(get_db)):
+    names = await resolve_names(db, [s.exercise_name for ex in workout.exercises for s in ex.sets])
     new_workout = Workout(
         user_id = workout.user_id,
         exercises = [
@@ -66,7 +120,7 @@ async def create_workout(workout: WorkoutCreate, db: Session = Depends(get_db)):
                 exercise_number = ex.exercise_number,
                 sets = [
                     Set(
-                        exercise_name = set_data.exercise_name,
+                        catalog_entry = names[set_data.exercise_name],
                         set_number = set_data.set_number,
                         subsets = [
                             Subset(reps = ss.reps, weight = ss.weight, subset_number=ss.subset_number)
@@ -81,38 +135,57 @@ async def create_workout(workout: WorkoutCreate, db: Session = Depends(get_db)):
     )
 
     db.add(new_workout)
-    db.commit()
-    db.refresh(new_workout)
-
-    workout_with_relations = db.query(Workout).options(
-        joinedload(Workout.exercises).joinedload(Exercise.sets).joinedload(Set.subsets)
-    ).filter(Workout.id == new_workout.id).first()
-
-    resources = get_all_parents(db=db, child_type="workouts", child_id=getattr(new_workout, "id"), result=[])
-    print(f"resources{resources}")
-    for resource in resources:
-        await websocket_manager.broadcast(
-            resource=resource,
-            data={
-                "type":"workout_created",
-                "data": WorkoutCreate.model_validate(workout_with_relations, from_attributes=True).model_dump(mode="json")
-          }
-        )
-
-    return workout_with_relations
-
-@router.post("/exercises")
-async def create_exercise(exercise: ExerciseCreate, db : Session = Depends(get_db)):
-    workout = db.get(Workout,exercise.workout_id)
+    await db.flush()
+    resources = await get_all_parents(db=db, child_type="workouts", child_id=getattr(new_workout, "id"))
+    records = await apply_rollup(db, Workout, [getattr(new_workout, "id")])
+    payload = await record_change(db, resources, "workout_created", WorkoutCreate.model_validate(new_workout, from_attributes=True))
+    record_events = await record_personal_records(db, records)
+    await db.commit()
+    resources_changed(resources)
+    await websocket_manager.broadcast_many(resources=resources, data=payload)
+    logger.debug("workout_created broadcast", extra={"resources": resources})
+    await publish(record_events)
+
+    return new_workout
+
+@router.post("/workouts/bulk", response_model=BulkImportResult)
+async def import_workouts(request: Request, db: AsyncSession = Depends(get_db)):
+    # Body is a JSON array of workouts, or one workout per line with Content-Type: application/x-ndjson
+    imported: Dict[int, List[int]] = {}
+    records = {}
+    async for batch in read_workouts(request):
+        workout_ids = await insert_workouts(db, batch)
+        for workout, workout_id in zip(batch, workout_ids):
+            imported.setdefault(workout.user_id, []).append(workout_id)
+        # Records only go up, so a later batch's row supersedes an earlier one
+        for record in await apply_rollup(db, Workout, workout_ids):
+            records[(record.user_id, record.exercise_name_id)] = record
+
+    # One summary event per user rather than one per workout
+    events = [
+        (f"users:{user_id}", await record_change(db, [f"users:{user_id}"], "workouts_imported", {"user_id": user_id, "workout_ids": workout_ids}))
+        for user_id, workout_ids in imported.items()
+    ]
+    events += await record_personal_records(db, records.values())
+    await db.commit()
+    await publish(events)
+
+    workout_ids = [workout_id for ids in imported.values() for workout_id in ids]
+    return BulkImportResult(imported=len(workout_ids), workout_ids=sorted(workout_ids))
+
+@router.post("/exercises", response_model=ExerciseRead)
+async def create_exercise(exercise: ExerciseCreate, db : AsyncSession = Depends(get_db)):
+    workout = await db.get(Workout,exercise.workout_id)
     if not workout:
         raise HTTPException(status_code=404, detail="Workout not found")
 
+    names = await resolve_names(db, [s.exercise_name for s in exercise.sets])
     new_exercise = Exercise(
         workout_id = exercise.workout_id,
         exercise_number = exercise.exercise_number,
         sets = [
             Set(
-                exercise_name = set_data.exercise_name,
+                catalog_entry = names[set_data.exercise_name],
                 set_number = set_data.set_number,
                 subsets = [
                     Subset(reps = ss.reps, weight = ss.weight, subset_number= ss.subset_number)
@@ -124,35 +197,29 @@ async def create_exercise(exercise: ExerciseCreate, db : Session = Depends(get_d
     )
 
     db.add(new_exercise)
-    db.commit()
-    db.refresh(new_exercise)
-
-    exercise_with_relations = db.query(Exercise).options(
-        joinedload(Exercise.sets).joinedload(Set.subsets)
-    ).filter(Exercise.id == new_exercise.id).first()
-
-    resources = get_all_parents(db=db, child_type="exercises", child_id=getattr(new_exercise, "id"), result=[])
-    print(f"resources{resources}")
-    for resource in resources:
-        await websocket_manager.broadcast(
-            resource=resource,
-            data={
-                "type":"exercise_created",
-                "data": ExerciseCreate.model_validate(exercise_with_relations, from_attributes=True).model_dump(mode="json")
-          }
-        )
-
-    return exercise_with_relations
-
-@router.post("/sets")
-async def create_set(set_data: SetCreate, db: Session = Depends(get_db)):
-    exercise = db.get(Exercise, set_data.exercise_id)
+    await db.flush()
+    resources = await get_all_parents(db=db, child_type="exercises", child_id=getattr(new_exercise, "id"))
+    records = await apply_rollup(db, Exercise, [getattr(new_exercise, "id")])
+    payload = await record_change(db, resources, "exercise_created", ExerciseCreate.model_validate(new_exercise, from_attributes=True))
+    record_events = await record_personal_records(db, records)
+    await db.commit()
+    resources_changed(resources)
+    await websocket_manager.broadcast_many(resources=resources, data=payload)
+    logger.debug("exercise_created broadcast", extra={"resources": resources})
+    await publish(record_events)
+
+    return new_exercise
+
+@router.post("/sets", response_model=SetRead)
+async def create_set(set_data: SetCreate, db: AsyncSession = Depends(get_db)):
+    exercise = await db.get(Exercise, set_data.exercise_id)
     if not exercise:
         raise HTTPException(status_code=404, detail="Exercise not found")
 
+    names = await resolve_names(db, [set_data.exercise_name])
     new_set = Set(
         exercise_id = set_data.exercise_id,
-        exercise_name = set_data.exercise_name,
+        catalog_entry = names[set_data.exercise_name],
         set_number = set_data.set_number,
         subsets = [
             Subset(reps = ss.reps, weight = ss.weight, subset_number = ss.subset_number)
@@ -161,45 +228,195 @@ async def create_set(set_data: SetCreate, db: Session = Depends(get_db)):
     )
 
     db.add(new_set)
-    db.commit()
-    db.refresh(new_set)
-
-    set_with_relations = db.query(Set).options(
-        joinedload(Set.subsets)
-    ).filter(Set.id == new_set.id).first()
-
-    resources = get_all_parents(db=db, child_type="sets", child_id=getattr(new_set, "id"), result=[])
-    print(f"resources{resources}")
-    for resource in resources:
-        await websocket_manager.broadcast(
-            resource=resource,
-            data={
-                "type":"set_created",
-                "data": SetCreate.model_validate(set_with_relations, from_attributes=True).model_dump(mode="json")
-          }
-        )
-    return set_with_relations
-
-@router.post("/subsets")
-async def create_subset(subset: SubsetCreate, db: Session = Depends(get_db)):
-    set_data = db.get(Set, subset.set_id)
+    await db.flush()
+    resources = await get_all_parents(db=db, child_type="sets", child_id=getattr(new_set, "id"))
+    records = await apply_rollup(db, Set, [getattr(new_set, "id")])
+    payload = await record_change(db, resources, "set_created", SetCreate.model_validate(new_set, from_attributes=True))
+    record_events = await record_personal_records(db, records)
+    await db.commit()
+    resources_changed(resources)
+    await websocket_manager.broadcast_many(resources=resources, data=payload)
+    logger.debug("set_created broadcast", extra={"resources": resources})
+    await publish(record_events)
+    return new_set
+
+@router.post("/subsets", response_model=SubsetRead)
+async def create_subset(subset: SubsetCreate, db: AsyncSession = Depends(get_db)):
+    set_data = await db.get(Set, subset.set_id)
     if not set_data:
         raise HTTPException(status_code=404, detail="Set not found")
 
     subset = Subset(reps = subset.reps, weight = subset.weight, set_id=subset.set_id, subset_number = subset.subset_number)
 
     db.add(subset)
-    db.commit()
-    db.refresh(subset)
-
-    resources = get_all_parents(db=db, child_type="subsets", child_id=getattr(subset, "id"), result=[])
-    print(f"resources{resources}")
-    for resource in resources:
-        await websocket_manager.broadcast(
-            resource=resource,
-            data={
-                "type":"subset_created",
-                "data": SubsetCreate.model_validate(subset, from_attributes=True).model_dump(mode="json")
-          }
-        )
+    await db.flush()
+    resources = await get_all_parents(db=db, child_type="subsets", child_id=getattr(subset, "id"))
+    records = await apply_rollup(db, Subset, [getattr(subset, "id")])
+    payload = await record_change(db, resources, "subset_created", SubsetCreate.model_validate(subset, from_attributes=True))
+    record_events = await record_personal_records(db, records)
+    await db.commit()
+    resources_changed(resources)
+    await websocket_manager.broadcast_many(resources=resources, data=payload)
+    logger.debug("subset_created broadcast", extra={"resources": resources})
+    await publish(record_events)
     return subset
+
+@router.post("/subsets/batch", response_model=List[SubsetRead])
+async def create_subsets(
+    subsets: List[SubsetCreate] = Body(min_length=1, max_length=MAX_BATCH_SUBSETS),
+    db: AsyncSession = Depends(get_db)
+):
+    # A whole drop set or pyramid, for one or more sets, in one transaction. Each set's parents are
+    # resolved once and subscribers get a single subsets_created event listing every new subset
+    set_ids = list(dict.fromkeys(subset.set_id for subset in subsets))
+    found = set(await db.scalars(select(Set.id).where(Set.id.in_(set_ids))))
+    if len(found) < len(set_ids):
+        raise HTTPException(status_code=404, detail="Set not found")
+
+    new_subsets = [
+        Subset(reps = ss.reps, weight = ss.weight, set_id = ss.set_id, subset_number = ss.subset_number)
+        for ss in subsets
+    ]
+    db.add_all(new_subsets)
+    await db.flush()
+
+    chains = [await get_all_parents(db=db, child_type="sets", child_id=set_id) for set_id in set_ids]
+    resources = list(dict.fromkeys(resource for chain in chains for resource in chain))
+    records = await apply_rollup(db, Subset, [getattr(subset, "id") for subset in new_subsets])
+    created = [SubsetRead.model_validate(subset) for subset in new_subsets]
+    payload = await record_change(db, resources, "subsets_created", [subset.model_dump() for subset in created])
+    record_events = await record_personal_records(db, records)
+    await db.commit()
+    resources_changed(resources)
+    await websocket_manager.broadcast_many(resources=resources, data=payload)
+    logger.debug("subsets_created broadcast", extra={"resources": resources})
+    await publish(record_events)
+    return created
+
+
+# Patch and delete requests
+# Each row is changed by a single statement, deletes cascade to its children in the database. The
+# row's rollup contributions are taken out before the change and added back after it, and the
+# records they counted towards are recomputed. Events fan out through the ancestors like creates
+ORDER_FIELDS = {"exercise_number", "set_number", "subset_number"}  # don't touch the rollups
+
+
+def not_found(kind: str) -> HTTPException:
+    return HTTPException(status_code=404, detail=f"{kind[:-1].capitalize()} not found")
+
+async def resolve_parents(db: AsyncSession, kind: str, id: int) -> List[str]:
+    try:
+        return await get_all_parents(db=db, child_type=kind, child_id=id)
+    except RuntimeError:
+        raise not_found(kind)
+
+async def update_row(
+    db: AsyncSession, kind: str, id: int, changes: Dict[str, Any], to_row: Callable[[Any], Awaitable[BaseModel]]
+) -> BaseModel:
+    if not changes:
+        raise HTTPException(status_code=422, detail="Nothing to update")
+    model = model_map[kind][1]
+    parent_type = parent_map[kind]
+    parent_column, parent_model = model_map[parent_type]
+    if parent_column in changes and not await db.get(parent_model, changes[parent_column]):
+        raise not_found(parent_type)
+
+    resources = await resolve_parents(db, kind, id)
+    rollups = not changes.keys() <= ORDER_FIELDS
+    pairs = await remove_rollup(db, model, [id]) if rollups else []
+    row = (await db.execute(
+        update(model).where(getattr(model, "id") == id).values(**changes).returning(*model.__table__.columns)
+    )).one_or_none()
+    if row is None:
+        raise not_found(kind)
+
+    if parent_column in changes:
+        # Moved: the event goes to the new ancestors and the old ones
+        forget_parents([resources[0]])
+        pending_parents(db.sync_session).pop(resources[0], None)
+        moved_to = await get_all_parents(db=db, child_type=kind, child_id=id)
+        resources = moved_to + [r for r in resources[1:] if r not in moved_to]
+
+    records = []
+    if rollups:
+        records = await apply_rollup(db, model, [id])
+        await recompute_records(db, pairs)
+    data = await to_row(row)
+    payload = await record_change(db, resources, f"{kind[:-1]}_updated", data)
+    record_events = await record_personal_records(db, records)
+    await db.commit()
+    resources_changed(resources)
+    await websocket_manager.broadcast_many(resources=resources, data=payload)
+    logger.debug("%s_updated broadcast", kind[:-1], extra={"resources": resources})
+    await publish(record_events)
+    return data
+
+async def delete_row(db: AsyncSession, kind: str, id: int) -> Response:
+    model = model_map[kind][1]
+    parent_column = model_map[parent_map[kind]][0]
+    ancestors = await resolve_parents(db, kind, id)
+    # The cascade takes the children too, their cached reads and links go with the row
+    descendants = await get_all_descendants(db, kind, id)
+    pairs = await remove_rollup(db, model, [id])
+    parent_id = (await db.execute(
+        delete(model).where(getattr(model, "id") == id).returning(getattr(model, parent_column))
+    )).scalar_one_or_none()
+    if parent_id is None:
+        raise not_found(kind)
+
+    await recompute_records(db, pairs)
+    resources = ancestors + descendants
+    payload = await record_change(db, resources, f"{kind[:-1]}_deleted", {"id": id, parent_column: parent_id})
+    await db.commit()
+    forget_parents([ancestors[0], *descendants])
+    resources_changed(resources)
+    await websocket_manager.broadcast_many(resources=resources, data=payload)
+    logger.debug("%s_deleted broadcast", kind[:-1], extra={"resources": resources})
+    return Response(status_code=204)
+
+
+@router.patch("/workouts/{id}", response_model=WorkoutRow)
+async def update_workout(id: int, workout: WorkoutUpdate, db: AsyncSession = Depends(get_db)):
+    async def to_row(row):
+        return WorkoutRow.model_validate(row)
+    return await update_row(db, "workouts", id, workout.model_dump(exclude_none=True), to_row)
+
+@router.patch("/exercises/{id}", response_model=ExerciseRow)
+async def update_exercise(id: int, exercise: ExerciseUpdate, db: AsyncSession = Depends(get_db)):
+    async def to_row(row):
+        return ExerciseRow.model_validate(row)
+    return await update_row(db, "exercises", id, exercise.model_dump(exclude_none=True), to_row)
+
+@router.patch("/sets/{id}", response_model=SetRow)
+async def update_set(id: int, set_data: SetUpdate, db: AsyncSession = Depends(get_db)):
+    changes = set_data.model_dump(exclude_none=True)
+    if "exercise_name" in changes:
+        name = changes.pop("exercise_name")
+        changes["exercise_name_id"] = (await resolve_names(db, [name]))[name].id
+
+    async def to_row(row):
+        name = await db.scalar(select(ExerciseName.name).where(ExerciseName.id == row.exercise_name_id))
+        return SetRow(id=row.id, exercise_id=row.exercise_id, exercise_name=name, set_number=row.set_number)
+    return await update_row(db, "sets", id, changes, to_row)
+
+@router.patch("/subsets/{id}", response_model=SubsetRow)
+async def update_subset(id: int, subset: SubsetUpdate, db: AsyncSession = Depends(get_db)):
+    async def to_row(row):
+        return SubsetRow.model_validate(row)
+    return await update_row(db, "subsets", id, subset.model_dump(exclude_none=True), to_row)
+
+@router.delete("/workouts/{id}", status_code=204)
+async def delete_workout(id: int, db: AsyncSession = Depends(get_db)):
+    return await delete_row(db, "workouts", id)
+
+@router.delete("/exercises/{id}", status_code=204)
+async def delete_exercise(id: int, db: AsyncSession = Depends(get_db)):
+    return await delete_row(db, "exercises", id)
+
+@router.delete("/sets/{id}", status_code=204)
+async def delete_set(id: int, db: AsyncSession = Depends(get_db)):
+    return await delete_row(db, "sets", id)
+
+@router.delete("/subsets/{id}", status_code=204)
+async def delete_subset(id: int, db: AsyncSession = Depends(get_db)):
+    return await delete_row(db, "subsets", id)
@@ -0,0 +1,73 @@
+"""
+Measure WebSocketManager.broadcast cost as idle connections grow.
+
+A fixed number of sockets subscribe to the broadcast resource while the idle
+connections subscribe to unrelated resources. With the resource -> sockets index
+broadcast cost should stay flat; the linear scan it replaced is shown for comparison.
+
+    python -m benchmarks.broadcast --idle 100 1000 10000 50000
+"""
+import argparse
+import asyncio
+import json
+import time
+from ws_manager import WebSocketManager
+
+
+class NullWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        pass
+
+
+async def linear_scan(manager: WebSocketManager, resource: str, data: dict):
+    # Previous implementation: visit every connection, search its resources and encode per socket
+    for ws, resources in manager.subscriptions.items():
+        if resource in list(resources):
+            await ws.send_text(json.dumps({**data, "resource": resource}))
+
+
+async def measure(idle: int, listeners: int, repeat: int):
+    manager = WebSocketManager()
+    for i in range(idle):
+        ws = NullWebSocket()
+        await manager.connect(ws)
+        manager.subscribe(websocket=ws, resource=f"users:{i + 2}")
+        manager.subscribe(websocket=ws, resource=f"workouts:{i + 2}")
+    for _ in range(listeners):
+        ws = NullWebSocket()
+        await manager.connect(ws)
+        manager.subscribe(websocket=ws, resource="users:1")
+
+    data = {"type": "workout_created", "data": {"user_id": 1}}
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await manager.broadcast(resource="users:1", data=data)
+    indexed = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await linear_scan(manager, "users:1", data)
+    scanned = (time.perf_counter() - start) / repeat * 1e6
+
+    return indexed, scanned
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--listeners", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'idle':>8}{'indexed us':>14}{'linear us':>14}")
+    for idle in args.idle:
+        indexed, scanned = asyncio.run(measure(idle, args.listeners, args.repeat))
+        print(f"{idle:>8}{indexed:>14.1f}{scanned:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
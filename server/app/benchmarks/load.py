@@ -0,0 +1,237 @@
+"""
+Drive concurrent REST traffic against a running server while websocket subscribers listen.
+
+Starts uvicorn on the database in DATABASE_URL (tables are dropped and recreated, do not
+point this at real data), seeds USERS x WORKOUTS copies of tests/data/workout.json through
+the bulk import, opens SUBSCRIBERS websockets spread over the seeded users, workouts and sets,
+then runs CONCURRENCY clients mixing GET /api/workouts/{id}, POST /api/subsets and
+POST /api/workouts for DURATION seconds. Reports throughput and p50/p99 latency per
+operation, and how long subset_created events took from the request to each subscriber.
+
+    DATABASE_URL=sqlite:////tmp/load.db python -m benchmarks.load --users 20 --subscribers 2000
+
+With --workers above 1, set WS_BACKEND=postgres so broadcasts reach every worker.
+--url runs against a server that is already up and leaves its tables alone.
+"""
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import httpx
+import websockets
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKOUT_JSON = os.path.join(APP_DIR, "tests", "data", "workout.json")
+
+OPERATIONS = ("get_workout", "post_subset", "post_workout")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def reset_database() -> None:
+    # Everything in the database goes, so the migrations start from an empty schema
+    from sqlalchemy import MetaData
+    from database import engine, setup_database
+    existing = MetaData()
+    existing.reflect(bind=engine)
+    existing.drop_all(bind=engine)
+    setup_database()
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning", "--backlog", "4096"]
+    return subprocess.Popen(command, cwd=APP_DIR)
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not come up")
+        await asyncio.sleep(0.2)
+
+
+class Tree:
+    """Ids of the seeded rows the traffic and subscribers pick from"""
+    def __init__(self):
+        self.users: List[int] = []
+        self.workouts: List[int] = []
+        self.sets: List[int] = []
+
+
+async def seed(client: httpx.AsyncClient, users: int, workouts: int) -> Tree:
+    with open(WORKOUT_JSON) as f:
+        template = json.load(f)["workout"]
+
+    tree = Tree()
+    for i in range(users):
+        user = (await client.post("/api/users", json={"name": f"Load User {i}"})).json()
+        tree.users.append(user["id"])
+        body = [{**copy.deepcopy(template), "user_id": user["id"]} for _ in range(workouts)]
+        result = (await client.post("/api/workouts/bulk", json=body)).json()
+        tree.workouts += result["workout_ids"]
+
+    # Sets of a sample of workouts are enough to spread subset writes and subscriptions
+    for workout_id in tree.workouts[:100]:
+        workout = (await client.get(f"/api/workouts/{workout_id}")).json()
+        tree.sets += [s["id"] for e in workout["exercises"] for s in e["sets"]]
+    return tree
+
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        # (set_id, subset_number) of each subset write -> when the request was sent
+        self.sent_at: Dict[Tuple[int, int], float] = {}
+        self.lags: List[float] = []
+        self.frames = 0
+        self.subscribed = 0
+
+
+async def subscriber(url: str, topic: str, results: Results, ready: asyncio.Semaphore, stop: asyncio.Event) -> None:
+    async with ready:
+        ws = await websockets.connect(url, max_queue=None)
+        await ws.send(json.dumps({"type": "subscribe", "resource": topic}))
+        await ws.recv()
+        results.subscribed += 1
+
+    try:
+        while not stop.is_set():
+            try:
+                frame = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            received = time.perf_counter()
+            results.frames += 1
+            message = json.loads(frame)
+            for event in message["events"] if message["type"] == "batch" else [message]:
+                if event["type"] == "subset_created":
+                    sent = results.sent_at.get((event["data"]["set_id"], event["data"]["subset_number"]))
+                    if sent is not None:
+                        results.lags.append(received - sent)
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        await ws.close()
+
+
+async def worker(client: httpx.AsyncClient, tree: Tree, weights: List[float], subset_numbers: itertools.count,
+                 results: Results, deadline: float, template: dict) -> None:
+    while time.perf_counter() < deadline:
+        operation = random.choices(OPERATIONS, weights)[0]
+        started = time.perf_counter()
+        if operation == "get_workout":
+            response = await client.get(f"/api/workouts/{random.choice(tree.workouts)}")
+        elif operation == "post_subset":
+            # A unique subset_number per write identifies its broadcast on the subscriber side
+            set_id, number = random.choice(tree.sets), next(subset_numbers)
+            results.sent_at[(set_id, number)] = started
+            response = await client.post("/api/subsets", json={"set_id": set_id, "reps": 5, "weight": 60.0, "subset_number": number})
+        else:
+            response = await client.post("/api/workouts", json={**template, "user_id": random.choice(tree.users)})
+
+        if response.status_code >= 400:
+            results.errors[operation] += 1
+        else:
+            results.latencies[operation].append(time.perf_counter() - started)
+
+
+async def run(args: argparse.Namespace) -> None:
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    ws_url = base_url.replace("http", "ws", 1) + "/ws"
+    with open(WORKOUT_JSON) as f:
+        template = json.load(f)["workout"]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_until_up(client)
+        start = time.perf_counter()
+        tree = await seed(client, args.users, args.workouts)
+        print(f"seeded {len(tree.users)} users, {len(tree.workouts)} workouts in {time.perf_counter() - start:.1f}s")
+
+        results = Results()
+        stop = asyncio.Event()
+        ready = asyncio.Semaphore(200)  # sockets opening at once
+        topics = [f"users:{i}" for i in tree.users] + [f"workouts:{i}" for i in tree.workouts[:100]] + [f"sets:{i}" for i in tree.sets]
+        listeners = [
+            asyncio.create_task(subscriber(ws_url, topics[i % len(topics)], results, ready, stop))
+            for i in range(args.subscribers)
+        ]
+        while results.subscribed < args.subscribers:
+            if any(task.done() and task.exception() for task in listeners):
+                raise next(task.exception() for task in listeners if task.done() and task.exception())
+            await asyncio.sleep(0.1)
+        print(f"{results.subscribed} subscribers connected")
+
+        weights = [args.reads, args.subset_writes, args.workout_writes]
+        deadline = time.perf_counter() + args.duration
+        subset_numbers = itertools.count(1000)
+        await asyncio.gather(*(
+            worker(client, tree, weights, subset_numbers, results, deadline, template)
+            for _ in range(args.concurrency)
+        ))
+        await asyncio.sleep(1)  # let the last broadcasts land
+        stop.set()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+    print(f"{'operation':<14}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for operation in OPERATIONS:
+        latencies = results.latencies[operation]
+        print(f"{operation:<14}{len(latencies):>10}{results.errors[operation]:>8}{len(latencies) / args.duration:>10.1f}"
+              f"{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}")
+    print(f"{'delivery lag':<14}{len(results.lags):>10}{'':>8}{results.frames / args.duration:>10.1f}"
+          f"{percentile(results.lags, 0.5) * 1000:>10.2f}{percentile(results.lags, 0.99) * 1000:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--workouts", type=int, default=10, help="seeded workouts per user")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--reads", type=float, default=6, help="weight of GET /api/workouts/{id}")
+    parser.add_argument("--subset-writes", type=float, default=3, help="weight of POST /api/subsets")
+    parser.add_argument("--workout-writes", type=float, default=1, help="weight of POST /api/workouts")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--url", help="use a server that is already running")
+    args = parser.parse_args()
+
+    # Every subscriber and client connection is a file descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    server = None
+    if not args.url:
+        reset_database()
+        server = start_server(args.port, args.workers)
+    try:
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
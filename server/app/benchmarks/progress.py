@@ -0,0 +1,112 @@
+"""
+Compare the SQL progression aggregate with aggregating downloaded workout trees in Python.
+
+Seeds USERS x WORKOUTS x EXERCISES x SETS x SUBSETS rows (1M subsets by default) into the
+database pointed to by DATABASE_URL (tables are dropped and recreated, do not point this at
+real data) and times both approaches for one user and exercise.
+
+    DATABASE_URL=postgresql://user@localhost/bench python -m benchmarks.progress
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, List
+from sqlalchemy import insert, select
+from database import engine, Base, SessionLocal
+from schemas.users import User
+from schemas.workouts import Workout, Exercise, Set, Subset, ExerciseName, normalize_name
+from api.analytics import progress_query
+from api.util import workout_tree
+
+EXERCISE_NAMES = ["Bench Press", "Squats", "Deadlift", "Overhead Press", "Barbell Row", "Pull-ups", "Dips", "Lunges"]
+
+
+def seed(users: int, workouts: int, exercises: int, sets: int, subsets: int) -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u + 1, "name": f"User {u + 1}"} for u in range(users)])
+        conn.execute(insert(ExerciseName), [
+            {"id": i + 1, "name": name, "normalized": normalize_name(name)} for i, name in enumerate(EXERCISE_NAMES)
+        ])
+
+        workout_id = exercise_id = set_id = 0
+        for u in range(users):
+            workout_rows, exercise_rows, set_rows, subset_rows = [], [], [], []
+            for _ in range(workouts):
+                workout_id += 1
+                workout_rows.append({"id": workout_id, "user_id": u + 1})
+                for e in range(exercises):
+                    exercise_id += 1
+                    exercise_rows.append({"id": exercise_id, "workout_id": workout_id, "exercise_number": e + 1})
+                    name_id = (workout_id + e) % len(EXERCISE_NAMES) + 1
+                    for s in range(sets):
+                        set_id += 1
+                        set_rows.append({"id": set_id, "exercise_id": exercise_id, "exercise_name_id": name_id, "set_number": s + 1})
+                        subset_rows.extend(
+                            {"set_id": set_id, "reps": 12 - ss % 8, "weight": 40.0 + (workout_id % 50) + ss * 2.5, "subset_number": ss + 1}
+                            for ss in range(subsets)
+                        )
+            conn.execute(insert(Workout), workout_rows)
+            conn.execute(insert(Exercise), exercise_rows)
+            conn.execute(insert(Set), set_rows)
+            conn.execute(insert(Subset), subset_rows)
+
+
+def in_sql(user_id: int, exercise: str) -> int:
+    with engine.connect() as conn:
+        return len(conn.execute(progress_query(user_id, exercise)).all())
+
+
+def in_python(user_id: int, exercise: str) -> int:
+    # What a client has to do today: fetch every workout tree and aggregate locally
+    with SessionLocal() as db:
+        workouts = db.scalars(select(Workout).options(workout_tree()).where(Workout.user_id == user_id)).all()
+        progress = []
+        for workout in workouts:
+            subsets = [ss for ex in workout.exercises for s in ex.sets if s.exercise_name == exercise for ss in s.subsets]
+            if subsets:
+                progress.append((
+                    sum(ss.reps * ss.weight for ss in subsets),
+                    max(ss.weight for ss in subsets),
+                    max(ss.weight * (1 + ss.reps / 30) for ss in subsets),
+                ))
+        return len(progress)
+
+
+def timed(run: Callable[[], int], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--workouts", type=int, default=400, help="per user")
+    parser.add_argument("--exercises", type=int, default=5)
+    parser.add_argument("--sets", type=int, default=5)
+    parser.add_argument("--subsets", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the previously seeded data")
+    args = parser.parse_args()
+
+    total = args.users * args.workouts * args.exercises * args.sets * args.subsets
+    if not args.skip_seed:
+        start = time.perf_counter()
+        seed(args.users, args.workouts, args.exercises, args.sets, args.subsets)
+        print(f"seeded {total} subsets in {time.perf_counter() - start:.1f}s ({engine.dialect.name})")
+
+    print(f"{'approach':<10}{'workouts':>10}{'p50 ms':>10}{'max ms':>10}")
+    for name, run in (("sql", in_sql), ("python", in_python)):
+        rows = run(1, "Bench Press")
+        timings = timed(lambda: run(1, "Bench Press"), args.repeat)
+        print(f"{name:<10}{rows:>10}{statistics.median(timings):>10.1f}{max(timings):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
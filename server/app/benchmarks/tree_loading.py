@@ -0,0 +1,126 @@
+"""
+Compare joinedload and selectinload for reading full workout trees.
+
+Seeds workouts of EXERCISES x SETS x SUBSETS into the database pointed to by
+DATABASE_URL (tables are dropped and recreated, do not point this at real data)
+and reports statements, result rows, approximate result bytes and latency per strategy.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.tree_loading --workouts 20
+"""
+import argparse
+import statistics
+import time
+from typing import List, Tuple
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+from database import engine, Base, SessionLocal
+from schemas.users import User
+from schemas.workouts import Workout, Exercise, Set, Subset, ExerciseName, normalize_name
+from api.util import workout_tree
+
+STRATEGIES = {
+    "joinedload": lambda: joinedload(Workout.exercises).joinedload(Exercise.sets).joinedload(Set.subsets),
+    "selectinload": workout_tree,
+}
+
+
+def seed(workouts: int, exercises: int, sets: int, subsets: int) -> List[int]:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    with SessionLocal() as db:
+        user = User(name="Benchmark User")
+        names = [ExerciseName(name=f"Exercise {e}", normalized=normalize_name(f"Exercise {e}")) for e in range(exercises)]
+        db.add(user)
+        db.add_all(names)
+        db.flush()
+
+        new_workouts = [
+            Workout(
+                user_id = user.id,
+                exercises = [
+                    Exercise(
+                        exercise_number = e,
+                        sets = [
+                            Set(
+                                catalog_entry = names[e],
+                                set_number = s,
+                                subsets = [Subset(reps=10, weight=60.0 + ss, subset_number=ss) for ss in range(subsets)]
+                            )
+                            for s in range(sets)
+                        ]
+                    )
+                    for e in range(exercises)
+                ]
+            )
+            for _ in range(workouts)
+        ]
+        db.add_all(new_workouts)
+        db.commit()
+        return [getattr(w, "id") for w in new_workouts]
+
+
+def capture_statements(strategy: str, workout_id: int) -> List[Tuple[str, object]]:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with SessionLocal() as db:
+            db.query(Workout).options(STRATEGIES[strategy]()).filter(Workout.id == workout_id).first()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def result_size(statements: List[Tuple[str, object]]) -> Tuple[int, int]:
+    # Re-run the captured SQL to measure what the driver has to ship back
+    rows = 0
+    size = 0
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            for row in conn.exec_driver_sql(statement, parameters):
+                rows += 1
+                size += sum(len(str(value)) for value in row)
+    return rows, size
+
+
+def time_load(strategy: str, workout_ids: List[int], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        for workout_id in workout_ids:
+            start = time.perf_counter()
+            with SessionLocal() as db:
+                workout = db.query(Workout).options(STRATEGIES[strategy]()).filter(Workout.id == workout_id).first()
+                jsonable_encoder(workout)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workouts", type=int, default=20)
+    parser.add_argument("--exercises", type=int, default=10)
+    parser.add_argument("--sets", type=int, default=5)
+    parser.add_argument("--subsets", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workout_ids = seed(args.workouts, args.exercises, args.sets, args.subsets)
+    print(f"{args.workouts} workouts of {args.exercises} exercises x {args.sets} sets x {args.subsets} subsets ({engine.dialect.name})")
+    print(f"{'strategy':<14}{'queries':>8}{'rows':>8}{'bytes':>10}{'p50 ms':>10}{'p99 ms':>10}")
+
+    for strategy in STRATEGIES:
+        statements = capture_statements(strategy, workout_ids[0])
+        rows, size = result_size(statements)
+        timings = sorted(time_load(strategy, workout_ids, args.repeat))
+        p50 = statistics.median(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f"{strategy:<14}{len(statements):>8}{rows:>8}{size:>10}{p50:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Change log retention.
+
+Every write logs its encoded event in Changes plus one ChangeResources row per resource it
+reached, so the log outgrows the workout data unless it is pruned. prune() drops changes older
+than CHANGES_RETENTION_DAYS and, when CHANGES_RETENTION_COUNT is set, all but that many of the
+newest. ChangeRetention remembers how far it went: GET /api/changes answers 410 for a `since`
+before that, and the client reloads the resource instead. The server prunes every
+CHANGES_PRUNE_INTERVAL_SECONDS; `python -m changelog` does it on demand.
+"""
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Engine, case, delete, func, select
+import os
+from database import dialect_inserts
+from schemas.changes import Change, ChangeResource, ChangeRetention
+
+RETENTION_DAYS = float(os.getenv("CHANGES_RETENTION_DAYS", "30"))
+RETENTION_COUNT = int(os.getenv("CHANGES_RETENTION_COUNT", "0")) or None
+PRUNE_INTERVAL_SECONDS = float(os.getenv("CHANGES_PRUNE_INTERVAL_SECONDS", "3600"))
+
+# Changes deleted per transaction, so writers are never held up for long
+PRUNE_BATCH = 10_000
+
+
+def prune_through(engine: Engine, days: float | None, count: int | None) -> int:
+    """Highest seq outside the retention window, 0 when everything is kept"""
+    with engine.connect() as conn:
+        newest = conn.execute(select(func.max(Change.seq))).scalar()
+        if newest is None:
+            return 0
+
+        limits = []
+        if days is not None:
+            if conn.dialect.name == "postgresql":
+                cutoff = func.now() - timedelta(days=days)
+            else:
+                # Stored as naive UTC by SQLite's CURRENT_TIMESTAMP
+                cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+            limits.append(conn.execute(select(func.max(Change.seq)).where(Change.created_at < cutoff)).scalar() or 0)
+        if count is not None:
+            limits.append(newest - count)
+
+    # The newest change always stays: SQLite numbers the next one from it
+    return min(max(limits, default=0), newest - 1)
+
+
+def prune(engine: Engine, days: float | None = RETENTION_DAYS, count: int | None = RETENTION_COUNT) -> int:
+    """Delete changes outside the retention window, returns how many went"""
+    through = prune_through(engine, days, count)
+    with engine.connect() as conn:
+        start = (conn.execute(select(func.min(Change.seq))).scalar() or 1) - 1
+    deleted = 0
+    while start < through:
+        end = min(start + PRUNE_BATCH, through)
+        with engine.begin() as conn:
+            conn.execute(
+                dialect_inserts[conn.dialect.name](ChangeRetention)
+                .values(id=1, pruned_through=end)
+                .on_conflict_do_update(index_elements=[ChangeRetention.id], set_={"pruned_through": case(
+                    (ChangeRetention.pruned_through > end, ChangeRetention.pruned_through), else_=end
+                )})
+            )
+            conn.execute(delete(ChangeResource).where(ChangeResource.seq > start, ChangeResource.seq <= end))
+            deleted += conn.execute(delete(Change).where(Change.seq > start, Change.seq <= end)).rowcount
+        start = end
+    return deleted
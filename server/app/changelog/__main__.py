@@ -0,0 +1,11 @@
+import argparse
+from database import engine
+from changelog import RETENTION_COUNT, RETENTION_DAYS, prune
+
+parser = argparse.ArgumentParser(description="Delete change log entries in DATABASE_URL that fall outside the retention window")
+parser.add_argument("--days", type=float, default=RETENTION_DAYS, help="keep changes newer than this")
+parser.add_argument("--count", type=int, default=RETENTION_COUNT, help="keep at most this many of the newest changes")
+args = parser.parse_args()
+
+deleted = prune(engine, days=args.days, count=args.count)
+print(f"Pruned {deleted} changes")
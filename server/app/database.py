@@ -1,21 +1,104 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import NullPool
+from typing import Any, AsyncIterator, Dict, Mapping
 import os
+from migrations import upgrade
+from metrics import instrument_engine
 
 database_url = os.getenv("DATABASE_URL")
 if not database_url:
     exit(1)
-engine = create_engine(database_url)
+
+# Same database, two drivers: a sync one for migrations and scripts, an async one for the API
+drivers = {
+    "postgresql": ("postgresql+psycopg2", "postgresql+asyncpg"),
+    "sqlite": ("sqlite", "sqlite+aiosqlite"),
+}
+
+def with_driver(url: str, sync: bool) -> URL:
+    parsed = make_url(url)
+    sync_driver, async_driver = drivers.get(parsed.get_backend_name(), (parsed.drivername, parsed.drivername))
+    return parsed.set(drivername=sync_driver if sync else async_driver)
+
+def engine_options(url: URL, env: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"pool_pre_ping": env.get("DB_POOL_PRE_PING", "true").lower() == "true"}
+
+    # DB_POOL_CLASS=null opens a connection per session. The test client runs each request on its
+    # own event loop and asyncpg connections cannot be shared between loops
+    if env.get("DB_POOL_CLASS") == "null":
+        options["poolclass"] = NullPool
+    elif url.get_backend_name() == "postgresql":
+        options["pool_size"] = int(env.get("DB_POOL_SIZE", "5"))
+        options["max_overflow"] = int(env.get("DB_MAX_OVERFLOW", "10"))
+        options["pool_timeout"] = float(env.get("DB_POOL_TIMEOUT", "30"))
+        options["pool_recycle"] = int(env.get("DB_POOL_RECYCLE", "1800"))
+
+    statement_timeout = env.get("DB_STATEMENT_TIMEOUT_MS")
+    if statement_timeout and url.get_backend_name() == "postgresql":
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": statement_timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+
+    return options
+
+# Pool settings only apply to the API engine, migrations must not hit the statement timeout
+engine = create_engine(with_driver(database_url, sync=True))
+async_url = with_driver(database_url, sync=False)
+async_engine = create_async_engine(async_url, **engine_options(async_url))
 Base = declarative_base()
 
+# SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked to on each connection
+def enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.close()
+
+for sqlite_engine in (engine, async_engine.sync_engine):
+    if sqlite_engine.dialect.name == "sqlite":
+        event.listen(sqlite_engine, "connect", enable_foreign_keys)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit, nothing is lazily reloaded outside the event loop
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 def setup_database():
-    Base.metadata.create_all(engine)
+    upgrade(engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+# A session only checks a connection out of the pool on its first query and returns it on commit
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# INSERT constructs with ON CONFLICT support, keyed by dialect name
+dialect_inserts = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+# Statement counts and timings for /metrics, per request and in total
+instrument_engine(async_engine.sync_engine)
+
+pool_events = {"connects": 0, "checkouts": 0, "invalidations": 0}
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def count_connect(dbapi_connection, connection_record):
+    pool_events["connects"] += 1
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_events["checkouts"] += 1
+
+@event.listens_for(async_engine.sync_engine, "invalidate")
+def count_invalidate(dbapi_connection, connection_record, exception):
+    pool_events["invalidations"] += 1
+
+def pool_stats() -> Dict[str, Any]:
+    pool = async_engine.pool
+    stats: Dict[str, Any] = {"pool": type(pool).__name__, **pool_events}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
@@ -0,0 +1,131 @@
+from typing import Any, Callable, Dict
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import Request, Response
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+# Stamped on every record made while a request or websocket is being handled
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+connection_id: ContextVar[str | None] = ContextVar("connection_id", default=None)
+
+# Attributes every LogRecord has, anything else was passed through extra= and is logged as a field
+RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id", "connection_id"}
+
+
+def install_record_factory() -> None:
+    # A factory rather than a filter, so the ids reach every handler (pytest's caplog included)
+    make_record = logging.getLogRecordFactory()
+    if getattr(make_record, "correlated", False):
+        return
+
+    def correlated(*args: Any, **kwargs: Any) -> logging.LogRecord:
+        record = make_record(*args, **kwargs)
+        record.request_id = request_id.get()
+        record.connection_id = connection_id.get()
+        return record
+
+    correlated.correlated = True
+    logging.setLogRecordFactory(correlated)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in ("request_id", "connection_id"):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        for name, value in vars(record).items():
+            if name not in RECORD_FIELDS:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG records, everything above passes"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class RecordQueueHandler(QueueHandler):
+    # The stock prepare() flattens the record into a formatted string, keep its fields for the JSON formatter
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+listener: QueueListener | None = None
+
+
+def setup_logging(level: str | None = None, sample_rate: float | None = None) -> None:
+    """
+    Route the root logger through a queue: the event loop only enqueues, a thread writes JSON lines
+    to stdout. DEBUG records are sampled before they are queued.
+    """
+    global listener
+    install_record_factory()
+    if listener is not None:
+        return
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = RecordQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_rate if sample_rate is not None else float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = QueueListener(records, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+
+
+access_logger = logging.getLogger("access")
+
+
+async def correlate_request(request: Request, call_next: Callable) -> Response:
+    # Callers may pass their own id to tie our logs to theirs
+    current = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id.set(current)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = current
+        access_logger.debug(
+            "%s %s", request.method, request.url.path,
+            extra={"status": response.status_code, "ms": round((time.perf_counter() - start) * 1000, 2)},
+        )
+        return response
+    finally:
+        request_id.reset(token)
@@ -1,11 +1,45 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
-from database import setup_database
-from api import users, workouts
-from ws_manager import websocket_manager
+import uuid
+from database import engine, setup_database, pool_stats
+from api import users, workouts, analytics, catalog, changes
+from ws_manager import websocket_manager, event_type
+from api.cache import response_cache, resources_changed
+from api.util import forget_parents
+import changelog
+import metrics
+import logs
 
-app = FastAPI(title = "Workout Backend")
+logs.setup_logging()
+logger = logging.getLogger(__name__)
+
+# Longest coalescing window a subscriber can ask for
+MAX_COALESCE_MS = 5000
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await websocket_manager.start()
+    pruning = asyncio.create_task(prune_changes()) if changelog.PRUNE_INTERVAL_SECONDS > 0 else None
+    yield
+    if pruning is not None:
+        pruning.cancel()
+    await websocket_manager.stop()
+
+async def prune_changes():
+    # Every worker prunes, the runs are idempotent
+    while True:
+        await asyncio.sleep(changelog.PRUNE_INTERVAL_SECONDS)
+        try:
+            deleted = await asyncio.to_thread(changelog.prune, engine)
+            logger.info("Pruned change log", extra={"deleted": deleted})
+        except Exception:
+            logger.exception("Pruning the change log failed")
+
+app = FastAPI(title = "Workout Backend", lifespan=lifespan)
 
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "").split(",")
 
@@ -15,10 +49,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Request-ID"],
 )
 
+app.middleware("http")(metrics.record_request)
+app.middleware("http")(logs.correlate_request)
+websocket_manager.on_sent = metrics.ws_send_seconds.observe
+
+# Writes on other workers reach this process as broadcasts, drop their cached trees too
+websocket_manager.add_listener(lambda resources, payload: resources_changed(resources))
+
+def forget_moved_parents(resources, payload):
+    # Updated rows may have moved and deleted ones are gone. The event also names ancestors whose
+    # links are still good, forgetting those costs one query on the next write
+    if (event_type(payload) or "").endswith(("_updated", "_deleted")):
+        forget_parents(resources)
+
+websocket_manager.add_listener(forget_moved_parents)
+
 app.include_router(users.router, prefix="/api")
 app.include_router(workouts.router, prefix="/api")
+app.include_router(analytics.router, prefix="/api")
+app.include_router(catalog.router, prefix="/api")
+app.include_router(changes.router, prefix="/api")
 
 from fastapi.responses import FileResponse
 @app.get("/test")
@@ -29,28 +82,63 @@ async def test_websocket():
 def root():
     return {"message": "Workout API is running!"}
 
+@app.get("/db/stats")
+def database_stats():
+    return pool_stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return response_cache.stats()
+
+@app.get("/ws/stats")
+def websocket_stats():
+    return websocket_manager.stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(content=metrics.render(websocket_manager.stats(), pool_stats()), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
+    # The connection's send task is created in connect() and inherits the id too
+    logs.connection_id.set(uuid.uuid4().hex)
     try:
         await websocket_manager.connect(ws)
+        logger.debug("Websocket connected")
 
         while True:
             data = await ws.receive_json()
 
             if data.get("type") == "subscribe":
                 resource = data.get("resource")
-                websocket_manager.subscribe(websocket=ws, resource=resource)
+                since = data.get("since")
+                if since is not None and (not isinstance(since, int) or isinstance(since, bool) or since < 0):
+                    websocket_manager.send(ws, {"type": "error", "detail": "since must be a sequence number"})
+                    continue
+                coalesce_ms = data.get("coalesce_ms", 0)
+                if not isinstance(coalesce_ms, int) or isinstance(coalesce_ms, bool) or not 0 <= coalesce_ms <= MAX_COALESCE_MS:
+                    websocket_manager.send(ws, {"type": "error", "detail": f"coalesce_ms must be between 0 and {MAX_COALESCE_MS}"})
+                    continue
 
-                await ws.send_json({"type": "subscribed", "resource": resource})
+                # Replayed events come first, "subscribed" marks the switch to live delivery.
+                # replayed is null when the gap is too old for the history, fetch it from /api/changes
+                replayed = websocket_manager.subscribe(websocket=ws, resource=resource, since=since, coalesce_ms=coalesce_ms)
+                ack = {"type": "subscribed", "resource": resource}
+                if since is not None:
+                    ack["replayed"] = replayed
+                if coalesce_ms:
+                    ack["coalesce_ms"] = coalesce_ms
+                websocket_manager.send(ws, ack)
 
     except WebSocketDisconnect:
+        logger.debug("Websocket disconnected")
         await websocket_manager.disconnect(ws)
 
-    except Exception as e:
-        print(f"Unable to connenct websocket: {e}")
+    except Exception:
+        logger.exception("Websocket closed on error")
         await websocket_manager.disconnect(ws)
 
 if __name__ == "__main__":
     import uvicorn
     setup_database()
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run("main:app", host="0.0.0.0", port=8080, workers=int(os.getenv("WEB_CONCURRENCY", "1")))
@@ -0,0 +1,140 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+from contextvars import ContextVar
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import bisect
+import time
+
+# Per process: with several workers, each one is scraped (or summed) on its own
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative bucket counts per label set, rendered in the Prometheus text format"""
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, Tuple[List[int], List[float]]] = {}  # labels -> (counts, [sum])
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def clear(self) -> None:
+        self.series.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total[0]}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+def render_values(name: str, kind: str, help: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+request_seconds = Histogram("http_request_duration_seconds", "Time to response start, per route")
+request_queries = Histogram("http_request_db_queries", "SQL statements executed per request, per route", QUERY_COUNT_BUCKETS)
+request_query_seconds = Histogram("http_request_db_seconds", "Time spent executing SQL per request, per route")
+ws_send_seconds = Histogram("ws_send_duration_seconds", "Time to write one frame to a websocket")
+
+queries = {"count": 0, "seconds": 0.0}
+
+# (statements, seconds) for the request being handled. Set per request, the hooks below add to it
+request_db: ContextVar[List[float] | None] = ContextVar("request_db", default=None)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement on engine, in total and against the current request"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.metrics_started
+        queries["count"] += 1
+        queries["seconds"] += elapsed
+        current = request_db.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += elapsed
+
+
+async def record_request(request: Request, call_next: Callable) -> Response:
+    db = [0, 0.0]
+    token = request_db.set(db)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    except Exception:
+        status = "500"
+        raise
+    finally:
+        request_db.reset(token)
+        # The route template, not the path, keeps one series per endpoint
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        request_seconds.observe(time.perf_counter() - start, method=request.method, route=route, status=status)
+        request_queries.observe(db[0], method=request.method, route=route)
+        request_query_seconds.observe(db[1], method=request.method, route=route)
+
+
+def render(ws_stats: Dict[str, int], pool_stats: Dict[str, int]) -> str:
+    lines: List[str] = []
+    for histogram in (request_seconds, request_queries, request_query_seconds, ws_send_seconds):
+        lines += histogram.render()
+
+    lines += render_values("db_queries_total", "counter", "SQL statements executed", queries["count"])
+    lines += render_values("db_query_seconds_total", "counter", "Time spent executing SQL", queries["seconds"])
+    for name in ("checkouts", "connects", "invalidations"):
+        lines += render_values(f"db_pool_{name}_total", "counter", f"Connection pool {name}", pool_stats[name])
+
+    gauges = {
+        "connections": "Open websocket connections",
+        "subscriptions": "Resource subscriptions across connections",
+        "queued": "Frames waiting in send queues",
+    }
+    counters = {
+        "events": "Broadcast events delivered to this process",
+        "fanout": "Frames queued for subscribers by broadcasts",
+        "sent": "Frames written to websockets",
+        "dropped": "Frames dropped by full send queues",
+        "coalesced": "Events sent inside batch frames",
+        "publish_failures": "Broadcasts the backend failed to publish",
+    }
+    for name, help in gauges.items():
+        lines += render_values(f"ws_{name}", "gauge", help, ws_stats[name])
+    for name, help in counters.items():
+        lines += render_values(f"ws_{name}_total", "counter", help, ws_stats[name])
+    return "\n".join(lines) + "\n"
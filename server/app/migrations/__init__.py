@@ -0,0 +1,60 @@
+"""
+Versioned schema migrations.
+
+Each module in migrations/versions is named v<NNNN>_<description>.py and defines
+upgrade(conn). Applied versions are recorded in the SchemaVersions table, so
+existing databases are brought up to date in place by running `python -m migrations`
+(setup_database() does the same on startup).
+"""
+import importlib
+import pkgutil
+from types import ModuleType
+from typing import List, Tuple
+from sqlalchemy import Column, DateTime, Engine, Integer, MetaData, String, Table, func, insert, select, text
+from sqlalchemy.engine import Connection
+from migrations import versions
+
+schema_versions = Table(
+    "SchemaVersions", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime, server_default=func.now()),
+)
+
+# Arbitrary key so concurrent workers starting up don't run the same migration twice
+ADVISORY_LOCK_ID = 7400211
+
+
+def load_migrations() -> List[Tuple[int, ModuleType]]:
+    migrations = []
+    for module in pkgutil.iter_modules(versions.__path__):
+        if not module.name.startswith("v"):
+            continue
+        version = int(module.name[1:5])
+        migrations.append((version, importlib.import_module(f"{versions.__name__}.{module.name}")))
+    return sorted(migrations, key=lambda m: m[0])
+
+
+def current_version(conn: Connection) -> int:
+    schema_versions.create(conn, checkfirst=True)
+    return conn.execute(select(func.coalesce(func.max(schema_versions.c.version), 0))).scalar_one()
+
+
+def upgrade(engine: Engine, target: int | None = None) -> List[int]:
+    applied = []
+    for version, migration in load_migrations():
+        if target is not None and version > target:
+            break
+
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+
+            if version <= current_version(conn):
+                continue
+
+            migration.upgrade(conn)
+            conn.execute(insert(schema_versions).values(version=version, description=migration.__doc__))
+
+        applied.append(version)
+    return applied
@@ -0,0 +1,10 @@
+import argparse
+from database import engine
+from migrations import upgrade
+
+parser = argparse.ArgumentParser(description="Upgrade the database in DATABASE_URL to the latest schema version")
+parser.add_argument("--target", type=int, default=None, help="stop after this version")
+args = parser.parse_args()
+
+applied = upgrade(engine, target=args.target)
+print(f"Applied migrations: {applied}" if applied else "Database is up to date")
@@ -0,0 +1,46 @@
+"""Baseline schema as created by Base.metadata.create_all"""
+from sqlalchemy import Column, Float, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table(
+    "Users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(64)),
+)
+
+Table(
+    "Workouts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("Users.id")),
+)
+
+Table(
+    "Exercises", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("workout_id", Integer, ForeignKey("Workouts.id")),
+    Column("exercise_number", Integer),
+)
+
+Table(
+    "Sets", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("exercise_id", Integer, ForeignKey("Exercises.id")),
+    Column("exercise_name", String),
+    Column("set_number", Integer),
+)
+
+Table(
+    "Subsets", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("set_id", Integer, ForeignKey("Sets.id")),
+    Column("reps", Integer),
+    Column("weight", Float),
+    Column("subset_number", Integer),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    # Databases created before migrations existed already have these tables
+    metadata.create_all(conn, checkfirst=True)
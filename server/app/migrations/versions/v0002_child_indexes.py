@@ -0,0 +1,22 @@
+"""Foreign-key and ordering indexes for child lookups"""
+from sqlalchemy import Column, Index, Integer, MetaData, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+workouts = Table("Workouts", metadata, Column("id", Integer), Column("user_id", Integer))
+exercises = Table("Exercises", metadata, Column("workout_id", Integer), Column("exercise_number", Integer))
+sets = Table("Sets", metadata, Column("exercise_id", Integer), Column("set_number", Integer))
+subsets = Table("Subsets", metadata, Column("set_id", Integer), Column("subset_number", Integer))
+
+indexes = [
+    Index("ix_Workouts_user_id_id", workouts.c.user_id, workouts.c.id),
+    Index("ix_Exercises_workout_id_exercise_number", exercises.c.workout_id, exercises.c.exercise_number),
+    Index("ix_Sets_exercise_id_set_number", sets.c.exercise_id, sets.c.set_number),
+    Index("ix_Subsets_set_id_subset_number", subsets.c.set_id, subsets.c.subset_number),
+]
+
+
+def upgrade(conn: Connection) -> None:
+    for index in indexes:
+        index.create(conn, checkfirst=True)
@@ -0,0 +1,13 @@
+"""Index sets by exercise name for progression queries"""
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+sets = Table("Sets", metadata, Column("exercise_id", Integer), Column("exercise_name", String))
+
+index = Index("ix_Sets_exercise_name_exercise_id", sets.c.exercise_name, sets.c.exercise_id)
+
+
+def upgrade(conn: Connection) -> None:
+    index.create(conn, checkfirst=True)
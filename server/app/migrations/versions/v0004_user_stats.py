@@ -0,0 +1,53 @@
+"""Per-user statistics and personal record rollups"""
+from sqlalchemy import Column, Float, ForeignKey, Integer, MetaData, String, Table, text
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table("Users", metadata, Column("id", Integer, primary_key=True))
+
+Table(
+    "UserStats", metadata,
+    Column("user_id", Integer, ForeignKey("Users.id"), primary_key=True),
+    Column("workouts", Integer, nullable=False),
+    Column("exercises", Integer, nullable=False),
+    Column("sets", Integer, nullable=False),
+    Column("subsets", Integer, nullable=False),
+    Column("reps", Integer, nullable=False),
+    Column("volume", Float, nullable=False),
+)
+
+Table(
+    "PersonalRecords", metadata,
+    Column("user_id", Integer, ForeignKey("Users.id"), primary_key=True),
+    Column("exercise_name", String, primary_key=True),
+    Column("top_weight", Float, nullable=False),
+    Column("estimated_1rm", Float, nullable=False),
+)
+
+BACKFILL_STATS = """
+INSERT INTO "UserStats" (user_id, workouts, exercises, sets, subsets, reps, volume)
+SELECT w.user_id, COUNT(DISTINCT w.id), COUNT(DISTINCT e.id), COUNT(DISTINCT s.id), COUNT(DISTINCT ss.id),
+       COALESCE(SUM(ss.reps), 0), COALESCE(SUM(ss.reps * ss.weight), 0.0)
+FROM "Workouts" w
+LEFT JOIN "Exercises" e ON e.workout_id = w.id
+LEFT JOIN "Sets" s ON s.exercise_id = e.id
+LEFT JOIN "Subsets" ss ON ss.set_id = s.id
+GROUP BY w.user_id
+"""
+
+BACKFILL_RECORDS = """
+INSERT INTO "PersonalRecords" (user_id, exercise_name, top_weight, estimated_1rm)
+SELECT w.user_id, s.exercise_name, MAX(ss.weight), MAX(ss.weight * (1 + ss.reps / 30.0))
+FROM "Workouts" w
+JOIN "Exercises" e ON e.workout_id = w.id
+JOIN "Sets" s ON s.exercise_id = e.id
+JOIN "Subsets" ss ON ss.set_id = s.id
+GROUP BY w.user_id, s.exercise_name
+"""
+
+
+def upgrade(conn: Connection) -> None:
+    metadata.create_all(conn, tables=[metadata.tables["UserStats"], metadata.tables["PersonalRecords"]], checkfirst=True)
+    conn.execute(text(BACKFILL_STATS))
+    conn.execute(text(BACKFILL_RECORDS))
@@ -0,0 +1,81 @@
+"""Move exercise names into the ExerciseNames catalog, sets reference it by id"""
+from collections import defaultdict
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, MetaData, String, Table, func, insert, select, text, update
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table("Users", metadata, Column("id", Integer, primary_key=True))
+
+exercise_names = Table(
+    "ExerciseNames", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("normalized", String, nullable=False),
+    Index("ix_ExerciseNames_normalized", "normalized", unique=True),
+)
+
+sets = Table(
+    "Sets", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("exercise_id", Integer),
+    Column("exercise_name", String),
+    Column("exercise_name_id", Integer),
+)
+
+personal_records = Table(
+    "PersonalRecords", metadata,
+    Column("user_id", Integer, ForeignKey("Users.id"), primary_key=True),
+    Column("exercise_name_id", Integer, ForeignKey("ExerciseNames.id"), primary_key=True),
+    Column("top_weight", Float, nullable=False),
+    Column("estimated_1rm", Float, nullable=False),
+)
+
+old_index = Index("ix_Sets_exercise_name_exercise_id", sets.c.exercise_name, sets.c.exercise_id)
+new_index = Index("ix_Sets_exercise_name_id_exercise_id", sets.c.exercise_name_id, sets.c.exercise_id)
+
+BACKFILL_RECORDS = """
+INSERT INTO "PersonalRecords" (user_id, exercise_name_id, top_weight, estimated_1rm)
+SELECT w.user_id, s.exercise_name_id, MAX(ss.weight), MAX(ss.weight * (1 + ss.reps / 30.0))
+FROM "Workouts" w
+JOIN "Exercises" e ON e.workout_id = w.id
+JOIN "Sets" s ON s.exercise_id = e.id
+JOIN "Subsets" ss ON ss.set_id = s.id
+GROUP BY w.user_id, s.exercise_name_id
+"""
+
+
+def normalize(name: str) -> str:
+    # Frozen copy of schemas.workouts.normalize_name
+    return " ".join(name.split()).casefold()
+
+
+def upgrade(conn: Connection) -> None:
+    exercise_names.create(conn, checkfirst=True)
+    conn.execute(text('ALTER TABLE "Sets" ADD COLUMN exercise_name_id INTEGER REFERENCES "ExerciseNames" (id)'))
+
+    # Spellings that differ only in case or whitespace become one entry, named after the most used spelling
+    spellings = defaultdict(list)
+    counts = select(func.coalesce(sets.c.exercise_name, ""), func.count()).group_by(sets.c.exercise_name)
+    for name, count in conn.execute(counts):
+        spellings[normalize(name)].append((count, name))
+
+    for key, variants in spellings.items():
+        _, canonical = max(sorted(variants, key=lambda v: v[1]), key=lambda v: v[0])
+        entry_id = conn.execute(
+            insert(exercise_names).values(name=" ".join(canonical.split()), normalized=key).returning(exercise_names.c.id)
+        ).scalar_one()
+        names = [name for _, name in variants]
+        matches = sets.c.exercise_name.in_(names)
+        if "" in names:
+            matches = matches | sets.c.exercise_name.is_(None)
+        conn.execute(update(sets).where(matches).values(exercise_name_id=entry_id))
+
+    old_index.drop(conn, checkfirst=True)
+    conn.execute(text('ALTER TABLE "Sets" DROP COLUMN exercise_name'))
+    new_index.create(conn, checkfirst=True)
+
+    # Records are derived data, rebuild them against the new key
+    conn.execute(text('DROP TABLE IF EXISTS "PersonalRecords"'))
+    personal_records.create(conn)
+    conn.execute(text(BACKFILL_RECORDS))
@@ -0,0 +1,29 @@
+"""Change log and sequence counter for delta sync"""
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, func
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table(
+    "Changes", metadata,
+    Column("seq", Integer, primary_key=True, autoincrement=False),
+    Column("event_type", String, nullable=False),
+    Column("payload", Text, nullable=False),
+    Column("created_at", DateTime, server_default=func.now()),
+)
+
+Table(
+    "ChangeResources", metadata,
+    Column("resource", String, primary_key=True),
+    Column("seq", Integer, ForeignKey("Changes.seq"), primary_key=True),
+)
+
+Table(
+    "ChangeSequence", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,19 @@
+"""Number changes from a database sequence instead of the single-row ChangeSequence counter"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def upgrade(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        # Same sequence SERIAL would have created, continuing after the last number handed out
+        conn.execute(text('CREATE SEQUENCE IF NOT EXISTS "Changes_seq_seq" OWNED BY "Changes".seq'))
+        conn.execute(text("""
+            SELECT setval('"Changes_seq_seq"', GREATEST(
+                (SELECT COALESCE(MAX(seq), 0) FROM "Changes"),
+                (SELECT COALESCE(MAX(value), 0) FROM "ChangeSequence")
+            ) + 1, false)
+        """))
+        conn.execute(text('ALTER TABLE "Changes" ALTER COLUMN seq SET DEFAULT nextval(\'"Changes_seq_seq"\')'))
+    # SQLite: "Changes".seq is an INTEGER PRIMARY KEY, already numbered by rowid
+
+    conn.execute(text('DROP TABLE IF EXISTS "ChangeSequence"'))
@@ -0,0 +1,91 @@
+"""Delete exercises, sets and subsets with their parent row, in the database"""
+from sqlalchemy import Column, Index, Integer, MetaData, Table, inspect, text
+from sqlalchemy.engine import Connection
+
+# (table, foreign key column, parent), parents first
+CASCADES = [
+    ("Exercises", "workout_id", "Workouts"),
+    ("Sets", "exercise_id", "Exercises"),
+    ("Subsets", "set_id", "Sets"),
+]
+
+# SQLite can't alter a foreign key, the tables are rebuilt with these definitions
+SQLITE_TABLES = {
+    "Exercises": """
+        CREATE TABLE "{name}" (
+            id INTEGER NOT NULL,
+            workout_id INTEGER,
+            exercise_number INTEGER,
+            PRIMARY KEY (id),
+            FOREIGN KEY(workout_id) REFERENCES "Workouts" (id) ON DELETE CASCADE
+        )""",
+    "Sets": """
+        CREATE TABLE "{name}" (
+            id INTEGER NOT NULL,
+            exercise_id INTEGER,
+            exercise_name_id INTEGER,
+            set_number INTEGER,
+            PRIMARY KEY (id),
+            FOREIGN KEY(exercise_id) REFERENCES "Exercises" (id) ON DELETE CASCADE,
+            FOREIGN KEY(exercise_name_id) REFERENCES "ExerciseNames" (id)
+        )""",
+    "Subsets": """
+        CREATE TABLE "{name}" (
+            id INTEGER NOT NULL,
+            set_id INTEGER,
+            reps INTEGER,
+            weight FLOAT,
+            subset_number INTEGER,
+            PRIMARY KEY (id),
+            FOREIGN KEY(set_id) REFERENCES "Sets" (id) ON DELETE CASCADE
+        )""",
+}
+COLUMNS = {
+    "Exercises": "id, workout_id, exercise_number",
+    "Sets": "id, exercise_id, exercise_name_id, set_number",
+    "Subsets": "id, set_id, reps, weight, subset_number",
+}
+
+metadata = MetaData()
+exercises = Table("Exercises", metadata, Column("workout_id", Integer), Column("exercise_number", Integer))
+sets = Table("Sets", metadata, Column("exercise_id", Integer), Column("set_number", Integer), Column("exercise_name_id", Integer))
+subsets = Table("Subsets", metadata, Column("set_id", Integer), Column("subset_number", Integer))
+
+INDEXES = {
+    "Exercises": [Index("ix_Exercises_workout_id_exercise_number", exercises.c.workout_id, exercises.c.exercise_number)],
+    "Sets": [
+        Index("ix_Sets_exercise_id_set_number", sets.c.exercise_id, sets.c.set_number),
+        Index("ix_Sets_exercise_name_id_exercise_id", sets.c.exercise_name_id, sets.c.exercise_id),
+    ],
+    "Subsets": [Index("ix_Subsets_set_id_subset_number", subsets.c.set_id, subsets.c.subset_number)],
+}
+
+
+def upgrade(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        inspector = inspect(conn)
+        for table, column, parent in CASCADES:
+            for foreign_key in inspector.get_foreign_keys(table):
+                if foreign_key["constrained_columns"] == [column]:
+                    conn.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT "{foreign_key["name"]}"'))
+            conn.execute(text(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_{column}_fkey" '
+                f'FOREIGN KEY ({column}) REFERENCES "{parent}" (id) ON DELETE CASCADE'
+            ))
+        return
+
+    # With foreign keys enforced, dropping a table checks its children. Rows are copied aside, the table
+    # dropped and recreated under its own name and refilled, so the children's checks (deferred to
+    # commit) find their parents again. Parents go first: no child has a cascading key yet when its
+    # parent is dropped
+    for table, _, _ in CASCADES:
+        conn.execute(text(SQLITE_TABLES[table].format(name=f"{table}_copy")))
+        conn.execute(text(f'INSERT INTO "{table}_copy" ({COLUMNS[table]}) SELECT {COLUMNS[table]} FROM "{table}"'))
+        # Only takes effect inside a transaction, which the INSERT has opened
+        conn.execute(text("PRAGMA defer_foreign_keys = ON"))
+        conn.execute(text(f'DROP TABLE "{table}"'))
+        conn.execute(text(SQLITE_TABLES[table].format(name=table)))
+        conn.execute(text(f'INSERT INTO "{table}" ({COLUMNS[table]}) SELECT {COLUMNS[table]} FROM "{table}_copy"'))
+        conn.execute(text(f'DROP TABLE "{table}_copy"'))
+        for index in INDEXES[table]:
+            index.create(conn)
@@ -0,0 +1,25 @@
+"""Prune watermark for the change log, and indexes pruning deletes by"""
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+changes = Table("Changes", metadata, Column("seq", Integer, primary_key=True), Column("created_at", DateTime))
+change_resources = Table("ChangeResources", metadata, Column("resource", String, primary_key=True), Column("seq", Integer, primary_key=True))
+
+Table(
+    "ChangeRetention", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("pruned_through", Integer, nullable=False),
+)
+
+INDEXES = [
+    Index("ix_Changes_created_at", changes.c.created_at),
+    Index("ix_ChangeResources_seq", change_resources.c.seq),
+]
+
+
+def upgrade(conn: Connection) -> None:
+    metadata.tables["ChangeRetention"].create(conn, checkfirst=True)
+    for index in INDEXES:
+        index.create(conn, checkfirst=True)
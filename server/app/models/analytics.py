@@ -0,0 +1,35 @@
+from pydantic import BaseModel, ConfigDict
+from typing import List
+
+
+class WorkoutProgress(BaseModel):
+    workout_id: int
+    sets: int
+    reps: int
+    volume: float         # Σ reps × weight, kg
+    top_weight: float     # heaviest subset, kg
+    estimated_1rm: float  # best Epley estimate, weight × (1 + reps / 30)
+
+class ExerciseProgress(BaseModel):
+    user_id: int
+    exercise: str
+    workouts: List[WorkoutProgress] = []
+
+class PersonalRecordRead(BaseModel):
+    exercise_name: str
+    top_weight: float
+    estimated_1rm: float
+
+    model_config = ConfigDict(from_attributes = True)
+
+class UserStatsRead(BaseModel):
+    user_id: int
+    workouts: int = 0
+    exercises: int = 0
+    sets: int = 0
+    subsets: int = 0
+    reps: int = 0
+    volume: float = 0.0   # Σ reps × weight, kg
+    records: List[PersonalRecordRead] = []
+
+    model_config = ConfigDict(from_attributes = True)
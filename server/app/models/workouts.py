@@ -45,3 +45,100 @@ class WorkoutData(BaseModel):
     model_config = ConfigDict(from_attributes = True)
 
 WorkoutCreate = WorkoutData
+
+
+# ---------- Responses ----------
+class SubsetRead(SubsetCreate):
+    id: int
+
+class SetRead(BaseModel):
+    id: int
+    exercise_id: int
+    exercise_name: str
+    set_number: int
+    subsets: List[SubsetRead] = []
+
+    model_config = ConfigDict(from_attributes = True)
+
+class ExerciseRead(BaseModel):
+    id: int
+    workout_id: int
+    exercise_number: int
+    sets: List[SetRead] = []
+
+    model_config = ConfigDict(from_attributes = True)
+
+class WorkoutRead(BaseModel):
+    id: int
+    user_id: int
+    exercises: List[ExerciseRead] = []
+
+    model_config = ConfigDict(from_attributes = True)
+
+
+# ---------- Summaries ----------
+class ExerciseSummary(BaseModel):
+    id: int
+    workout_id: int
+    exercise_number: int
+
+    model_config = ConfigDict(from_attributes = True)
+
+class WorkoutSummary(BaseModel):
+    id: int
+    user_id: int
+    exercises: List[ExerciseSummary] = []
+
+    model_config = ConfigDict(from_attributes = True)
+
+
+# ---------- Updates ----------
+# Only the fields sent are changed, a new parent id moves the row
+class WorkoutUpdate(BaseModel):
+    user_id: int | None = None
+
+class ExerciseUpdate(BaseModel):
+    workout_id: int | None = None
+    exercise_number: int | None = None
+
+class SetUpdate(BaseModel):
+    exercise_id: int | None = None
+    exercise_name: str | None = None
+    set_number: int | None = None
+
+class SubsetUpdate(BaseModel):
+    set_id: int | None = None
+    reps: int | None = None
+    subset_number: int | None = None
+    weight: float | None = None
+
+# The changed row without its children
+class WorkoutRow(BaseModel):
+    id: int
+    user_id: int
+
+    model_config = ConfigDict(from_attributes = True)
+
+ExerciseRow = ExerciseSummary
+
+class SetRow(BaseModel):
+    id: int
+    exercise_id: int
+    exercise_name: str
+    set_number: int
+
+    model_config = ConfigDict(from_attributes = True)
+
+SubsetRow = SubsetRead
+
+
+# ---------- Bulk import ----------
+class BulkImportResult(BaseModel):
+    imported: int
+    workout_ids: List[int]
+
+
+# ---------- Exercise names ----------
+class ExerciseNameRead(BaseModel):
+    id: int
+    name: str
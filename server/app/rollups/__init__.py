@@ -0,0 +1,146 @@
+"""
+Per-user statistics rollups.
+
+UserStats holds lifetime totals and PersonalRecords the best lift per exercise. Both are
+updated in the same transaction as the rows they summarise: the new subtree is aggregated
+in SQL and upserted as a delta, so reading them is a primary key lookup. Updates and deletes
+take the old subtree's totals back out (remove_rollup) and recompute the records it counted
+towards, since a maximum can't be subtracted. `python -m rollups` rebuilds everything from
+the workout tables.
+"""
+from typing import Iterable, List, NamedTuple, Sequence, Tuple
+from sqlalchemy import Engine, case, delete, func, insert, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import dialect_inserts
+from schemas.workouts import Workout, Exercise, Set, Subset, ExerciseName
+from schemas.stats import UserStats, PersonalRecord
+
+LEVELS = [Workout, Exercise, Set, Subset]
+JOINS = [
+    (Exercise, Exercise.workout_id == Workout.id),
+    (Set, Set.exercise_id == Exercise.id),
+    (Subset, Subset.set_id == Set.id),
+]
+COUNTS = ["workouts", "exercises", "sets", "subsets"]
+STATS_COLUMNS = ["user_id", *COUNTS, "reps", "volume"]
+RECORD_COLUMNS = ["user_id", "exercise_name_id", "top_weight", "estimated_1rm"]
+
+
+def subtree(root, *where):
+    # Ancestors of root are inner joined (they exist), descendants outer joined so empty levels still count
+    query = select().select_from(Workout)
+    for child, on in JOINS:
+        if LEVELS.index(child) <= LEVELS.index(root):
+            query = query.join(child, on)
+        else:
+            query = query.outerjoin(child, on)
+    return query.where(*where)
+
+
+def stats_source(root, *where, sign: int = 1):
+    # sign=-1 gives the delta that takes the subtrees back out
+    totals = [
+        func.count(func.distinct(level.id)) if LEVELS.index(level) >= LEVELS.index(root) else literal(0)
+        for level in LEVELS
+    ] + [
+        func.coalesce(func.sum(Subset.reps), 0),
+        func.coalesce(func.sum(Subset.reps * Subset.weight), 0.0),
+    ]
+    if sign != 1:
+        totals = [total * sign for total in totals]
+    return subtree(root, *where).add_columns(Workout.user_id, *totals).group_by(Workout.user_id)
+
+
+def records_source(*where):
+    return subtree(Subset, *where).add_columns(
+        Workout.user_id,
+        Set.exercise_name_id,
+        func.max(Subset.weight),
+        func.max(Subset.weight * (1 + Subset.reps / 30.0)),
+    ).group_by(Workout.user_id, Set.exercise_name_id)
+
+
+def add_stats(dialect: str, source):
+    statement = dialect_inserts[dialect](UserStats).from_select(STATS_COLUMNS, source)
+    return statement.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={c: getattr(UserStats, c) + getattr(statement.excluded, c) for c in STATS_COLUMNS[1:]},
+    )
+
+
+def raise_records(dialect: str, source):
+    # Only rows that were inserted or improved come back from RETURNING, those are the new records
+    statement = dialect_inserts[dialect](PersonalRecord).from_select(RECORD_COLUMNS, source)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[PersonalRecord.user_id, PersonalRecord.exercise_name_id],
+        set_={
+            c: case((getattr(excluded, c) > getattr(PersonalRecord, c), getattr(excluded, c)), else_=getattr(PersonalRecord, c))
+            for c in RECORD_COLUMNS[2:]
+        },
+        where=(excluded.top_weight > PersonalRecord.top_weight) | (excluded.estimated_1rm > PersonalRecord.estimated_1rm),
+    ).returning(*[getattr(PersonalRecord, c) for c in RECORD_COLUMNS])
+
+
+class NewRecord(NamedTuple):
+    user_id: int
+    exercise_name_id: int
+    exercise_name: str
+    top_weight: float
+    estimated_1rm: float
+
+
+async def apply_rollup(db: AsyncSession, root, ids: Sequence[int]) -> List[NewRecord]:
+    """Add the subtrees rooted at root.id in ids to the rollups. Call after flush, returns the new records"""
+    dialect = db.get_bind().dialect.name
+    await db.execute(add_stats(dialect, stats_source(root, root.id.in_(ids))))
+    raised = list(await db.execute(raise_records(dialect, records_source(root.id.in_(ids)))))
+    if not raised:
+        return []
+
+    # RETURNING can't join, names are read back from the catalog
+    name_ids = {record.exercise_name_id for record in raised}
+    names = dict((await db.execute(select(ExerciseName.id, ExerciseName.name).where(ExerciseName.id.in_(name_ids)))).all())
+    return [
+        NewRecord(r.user_id, r.exercise_name_id, names[r.exercise_name_id], r.top_weight, r.estimated_1rm)
+        for r in raised
+    ]
+
+
+async def remove_rollup(db: AsyncSession, root, ids: Sequence[int]) -> List[Tuple[int, int]]:
+    """
+    Take the subtrees rooted at root.id in ids out of the stats. Call before they are updated or deleted;
+    returns the (user_id, exercise_name_id) records they counted towards, for recompute_records afterwards
+    """
+    dialect = db.get_bind().dialect.name
+    pairs = await db.execute(
+        subtree(Subset, root.id.in_(ids)).add_columns(Workout.user_id, Set.exercise_name_id).distinct()
+    )
+    pairs = [(user_id, exercise_name_id) for user_id, exercise_name_id in pairs]
+    await db.execute(add_stats(dialect, stats_source(root, root.id.in_(ids), sign=-1)))
+    return pairs
+
+
+async def recompute_records(db: AsyncSession, pairs: Iterable[Tuple[int, int]]) -> None:
+    """Recompute the given (user_id, exercise_name_id) records from the workout tables"""
+    pairs = list(pairs)
+    if not pairs:
+        return
+    await db.execute(delete(PersonalRecord).where(tuple_(PersonalRecord.user_id, PersonalRecord.exercise_name_id).in_(pairs)))
+    await db.execute(insert(PersonalRecord).from_select(
+        RECORD_COLUMNS, records_source(tuple_(Workout.user_id, Set.exercise_name_id).in_(pairs))
+    ))
+
+
+def rebuild(engine: Engine, user_id: int | None = None) -> None:
+    """Recompute the rollups from scratch, for every user or just one"""
+    with engine.begin() as conn:
+        stats, records = delete(UserStats), delete(PersonalRecord)
+        where = []
+        if user_id is not None:
+            stats, records = stats.where(UserStats.user_id == user_id), records.where(PersonalRecord.user_id == user_id)
+            where = [Workout.user_id == user_id]
+        conn.execute(stats)
+        conn.execute(records)
+        conn.execute(insert(UserStats).from_select(STATS_COLUMNS, stats_source(Workout, *where)))
+        conn.execute(insert(PersonalRecord).from_select(RECORD_COLUMNS, records_source(*where)))
@@ -0,0 +1,10 @@
+import argparse
+from database import engine
+from rollups import rebuild
+
+parser = argparse.ArgumentParser(description="Rebuild the per-user statistics rollups in DATABASE_URL from the workout tables")
+parser.add_argument("--user-id", type=int, default=None, help="only rebuild this user")
+args = parser.parse_args()
+
+rebuild(engine, user_id=args.user_id)
+print("Rebuilt statistics" + (f" for user {args.user_id}" if args.user_id is not None else " for all users"))
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, ForeignKey, func
+from database import Base
+
+# Durable change log behind GET /changes, for clients that fell out of the in-memory history
+class Change(Base):
+    __tablename__ = "Changes"
+    # Drawn from a database sequence, so concurrent writers never wait on each other. Numbers
+    # can commit out of order, readers only serve the settled part of the log (see api/changes.py)
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(Text, nullable=False) # encoded event, as broadcast
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_Changes_created_at", "created_at"),  # pruning by age
+    )
+
+class ChangeResource(Base):
+    __tablename__ = "ChangeResources"
+    resource = Column(String, primary_key=True)
+    seq = Column(Integer, ForeignKey("Changes.seq"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_ChangeResources_seq", "seq"),  # pruning by seq
+    )
+
+# Single row: changes up to pruned_through are gone (see changelog), older deltas need a reload
+class ChangeRetention(Base):
+    __tablename__ = "ChangeRetention"
+    id = Column(Integer, primary_key=True)
+    pruned_through = Column(Integer, nullable=False)
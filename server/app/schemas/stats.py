@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey
+from database import Base
+
+# Rollups maintained incrementally by the create endpoints (see rollups/), rebuilt with `python -m rollups`
+class UserStats(Base):
+    __tablename__ = "UserStats"
+    user_id = Column(Integer, ForeignKey("Users.id"), primary_key=True)
+    workouts = Column(Integer, nullable=False, default=0)
+    exercises = Column(Integer, nullable=False, default=0)
+    sets = Column(Integer, nullable=False, default=0)
+    subsets = Column(Integer, nullable=False, default=0)
+    reps = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0) # Unit: kg
+
+class PersonalRecord(Base):
+    __tablename__ = "PersonalRecords"
+    user_id = Column(Integer, ForeignKey("Users.id"), primary_key=True)
+    exercise_name_id = Column(Integer, ForeignKey("ExerciseNames.id"), primary_key=True)
+    top_weight = Column(Float, nullable=False)
+    estimated_1rm = Column(Float, nullable=False)
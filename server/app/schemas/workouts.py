@@ -1,41 +1,81 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
+# Children are deleted by ON DELETE CASCADE in the database, passive_deletes keeps the ORM from loading them first.
+# They load in number order with ties broken by id, so a tree serializes the same on every worker (ETags hash it)
 class Subset(Base):
     __tablename__ = "Subsets"
     id = Column(Integer,primary_key=True)
-    set_id = Column(Integer, ForeignKey("Sets.id"))
+    set_id = Column(Integer, ForeignKey("Sets.id", ondelete="CASCADE"))
     reps = Column(Integer)
     weight = Column(Float) # Unit: kg
     subset_number = Column(Integer)
 
+    __table_args__ = (
+        Index("ix_Subsets_set_id_subset_number", "set_id", "subset_number"),
+    )
+
+class ExerciseName(Base):
+    # Catalog of exercise names, sets reference it by id. Names are looked up by their
+    # normalized form so "bench  press" and "Bench Press" are the same entry
+    __tablename__ = "ExerciseNames"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    normalized = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_ExerciseNames_normalized", "normalized", unique=True),
+    )
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
 class Set(Base):
     __tablename__ = "Sets"
     id = Column(Integer, primary_key=True)
-    exercise_id = Column(Integer, ForeignKey("Exercises.id"))
-    exercise_name = Column(String)
-    subsets = relationship("Subset", backref="set", cascade="all, delete-orphan")
+    exercise_id = Column(Integer, ForeignKey("Exercises.id", ondelete="CASCADE"))
+    exercise_name_id = Column(Integer, ForeignKey("ExerciseNames.id"))
+    catalog_entry = relationship("ExerciseName", lazy="joined", innerjoin=True)
+    subsets = relationship("Subset", backref="set", cascade="all, delete-orphan", passive_deletes=True, order_by="[Subset.subset_number, Subset.id]")
     set_number = Column(Integer)
 
+    __table_args__ = (
+        Index("ix_Sets_exercise_id_set_number", "exercise_id", "set_number"),
+        Index("ix_Sets_exercise_name_id_exercise_id", "exercise_name_id", "exercise_id"),
+    )
+
+    @property
+    def exercise_name(self):
+        return self.catalog_entry.name
+
 class Exercise(Base):
     __tablename__ = "Exercises"
     id = Column(Integer, primary_key=True)
-    workout_id = Column(Integer, ForeignKey("Workouts.id"))
-    sets = relationship("Set", backref="exercise", cascade="all, delete-orphan")
+    workout_id = Column(Integer, ForeignKey("Workouts.id", ondelete="CASCADE"))
+    sets = relationship("Set", backref="exercise", cascade="all, delete-orphan", passive_deletes=True, order_by="[Set.set_number, Set.id]")
     exercise_number = Column(Integer)
 
+    __table_args__ = (
+        Index("ix_Exercises_workout_id_exercise_number", "workout_id", "exercise_number"),
+    )
+
     @property
     def name(self):
         if not self.sets:
             return "Empty Exercise"
-        unique_names = list(set(s.exercise_name for s in self.sets))
-        if len(unique_names) == 1:
-            return unique_names[0]
-        return f"Superset - {', '.join(sorted(unique_names))}"
+        # The identity map holds one catalog object per name, so this dedupes by identity, not by string
+        entries = {s.catalog_entry for s in self.sets}
+        if len(entries) == 1:
+            return next(iter(entries)).name
+        return f"Superset - {', '.join(sorted(entry.name for entry in entries))}"
 
 class Workout(Base):
     __tablename__ = "Workouts"
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("Users.id"))
-    exercises = relationship("Exercise", backref="workout", cascade="all, delete-orphan")
+    exercises = relationship("Exercise", backref="workout", cascade="all, delete-orphan", passive_deletes=True, order_by="[Exercise.exercise_number, Exercise.id]")
+
+    __table_args__ = (
+        Index("ix_Workouts_user_id_id", "user_id", "id"),
+    )
@@ -1,7 +1,15 @@
+import os
+os.environ.setdefault("DB_POOL_CLASS", "null")
+os.environ.setdefault("CHANGES_SETTLE_SECONDS", "0")
+
 import pytest
 from database import engine, Base
 from fastapi.testclient import TestClient
 from main import app
+from api.util import clear_parent_cache
+from api.cache import response_cache
+from api.catalog import name_index
+from ws_manager import websocket_manager
 
 client = TestClient(app)
 
@@ -9,6 +17,10 @@ client = TestClient(app)
 def clean_database():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    clear_parent_cache()
+    response_cache.clear()
+    name_index.clear()
+    websocket_manager.history.clear()
 
     user_data = {"name": "Test User"}
     client.post("/api/users", json=user_data)
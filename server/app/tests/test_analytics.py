@@ -0,0 +1,135 @@
+from fastapi.testclient import TestClient
+from main import app
+from database import engine
+from rollups import rebuild
+from api.catalog import name_index
+from tests.util import create_workout, retrieve_workout, subscribe_and_listen
+import pytest
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def data():
+    return retrieve_workout()
+
+
+def test_progress_per_workout(data):
+    workout_ids = [create_workout(data)["id"] for _ in range(2)]
+
+    response = client.get("/api/users/1/progress", params={"exercise": "Bench Press"})
+    assert response.status_code == 200
+
+    progress = response.json()
+    assert progress["exercise"] == "Bench Press"
+    assert [w["workout_id"] for w in progress["workouts"]] == workout_ids
+
+    first = progress["workouts"][0]
+    assert first["sets"] == 3
+    assert first["reps"] == 24
+    assert first["volume"] == pytest.approx(10 * 80 + 8 * 85 + 6 * 90)
+    assert first["top_weight"] == 90.0
+    assert first["estimated_1rm"] == pytest.approx(90 * (1 + 6 / 30))
+
+
+def test_progress_counts_drop_set_subsets(data):
+    create_workout(data)
+
+    squats = client.get("/api/users/1/progress", params={"exercise": "Squats"}).json()["workouts"][0]
+    assert squats["sets"] == 3
+    assert squats["volume"] == pytest.approx(12 * 100 + 10 * 110 + 8 * (120 + 80 + 40))
+
+
+def test_progress_unknown_exercise(data):
+    create_workout(data)
+
+    response = client.get("/api/users/1/progress", params={"exercise": "Deadlift"})
+    assert response.status_code == 200
+    assert response.json()["workouts"] == []
+
+
+def test_progress_unknown_user():
+    response = client.get("/api/users/999/progress", params={"exercise": "Bench Press"})
+    assert response.status_code == 404
+
+
+def totals(workout):
+    subsets = [ss for ex in workout["exercises"] for s in ex["sets"] for ss in s["subsets"]]
+    return {
+        "exercises": len(workout["exercises"]),
+        "sets": sum(len(ex["sets"]) for ex in workout["exercises"]),
+        "subsets": len(subsets),
+        "reps": sum(ss["reps"] for ss in subsets),
+        "volume": sum(ss["reps"] * ss["weight"] for ss in subsets),
+    }
+
+
+def test_stats_follow_created_workouts(data):
+    for _ in range(2):
+        create_workout(data)
+
+    stats = client.get("/api/users/1/stats").json()
+    expected = totals(data["workout"])
+    assert stats["workouts"] == 2
+    for key in ("exercises", "sets", "subsets", "reps"):
+        assert stats[key] == 2 * expected[key]
+    assert stats["volume"] == pytest.approx(2 * expected["volume"])
+
+    records = {r["exercise_name"]: r for r in stats["records"]}
+    assert records["Bench Press"]["top_weight"] == 90.0
+    assert records["Bench Press"]["estimated_1rm"] == pytest.approx(90 * (1 + 6 / 30))
+
+
+def test_stats_follow_nested_creates(data):
+    workout = create_workout(data)
+    set_id = workout["exercises"][0]["sets"][0]["id"]
+
+    with subscribe_and_listen("users:1") as ws:
+        response = client.post("/api/subsets", json={"set_id": set_id, "reps": 3, "weight": 100.0, "subset_number": 2})
+        assert response.status_code == 200
+
+        message = ws.receive_json()
+        while message["type"] != "personal_record":
+            message = ws.receive_json()
+        assert message["data"]["exercise_name"] == "Bench Press"
+        assert message["data"]["top_weight"] == 100.0
+
+    client.post("/api/exercises", json={"workout_id": workout["id"], "exercise_number": 3, "sets": []})
+
+    stats = client.get("/api/users/1/stats").json()
+    expected = totals(data["workout"])
+    assert stats["exercises"] == expected["exercises"] + 1
+    assert stats["subsets"] == expected["subsets"] + 1
+    assert stats["volume"] == pytest.approx(expected["volume"] + 300.0)
+
+
+def test_stats_after_bulk_import_match_rebuild(data):
+    client.post("/api/workouts/bulk", json=[data["workout"]] * 3)
+    incremental = client.get("/api/users/1/stats").json()
+
+    rebuild(engine)
+    assert client.get("/api/users/1/stats").json() == incremental
+    assert incremental["workouts"] == 3
+
+
+def test_stats_without_workouts():
+    stats = client.get("/api/users/1/stats").json()
+    assert stats == {"user_id": 1, "workouts": 0, "exercises": 0, "sets": 0, "subsets": 0, "reps": 0, "volume": 0.0, "records": []}
+
+    assert client.get("/api/users/999/stats").status_code == 404
+
+
+def test_new_record_with_cold_name_index(data):
+    # After a restart, or when another worker created the name, the in-memory catalog doesn't know it
+    workout = create_workout(data)
+    name_index.clear()
+
+    set_id = workout["exercises"][1]["sets"][0]["id"]
+    with subscribe_and_listen("users:1") as ws:
+        response = client.post("/api/subsets", json={"set_id": set_id, "reps": 1, "weight": 200.0, "subset_number": 2})
+        assert response.status_code == 200
+
+        message = ws.receive_json()
+        while message["type"] != "personal_record":
+            message = ws.receive_json()
+    assert message["data"]["exercise_name"] == "Squats"
+    assert message["data"]["top_weight"] == 200.0
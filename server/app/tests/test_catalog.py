@@ -0,0 +1,72 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from main import app
+from database import SessionLocal
+from schemas.workouts import ExerciseName
+from api.catalog import NameIndex
+from tests.util import create_workout, retrieve_workout
+import pytest
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def data():
+    return retrieve_workout()
+
+
+def test_sets_share_catalog_entries(data):
+    workout = create_workout(data)
+    exercise_id = workout["exercises"][0]["id"]
+
+    response = client.post("/api/sets", json={"exercise_id": exercise_id, "exercise_name": "  bench   PRESS ", "set_number": 4, "subsets": []})
+    assert response.status_code == 200
+    assert response.json()["exercise_name"] == "Bench Press"
+
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(ExerciseName)) == 4
+
+
+def test_exercise_names_by_prefix(data):
+    create_workout(data)
+    exercise_id = client.get("/api/workouts").json()[0]["exercises"][0]["id"]
+    for number, name in enumerate(["Bent Over Row", "Benchmark Squat", "Deadlift"], start=4):
+        client.post("/api/sets", json={"exercise_id": exercise_id, "exercise_name": name, "set_number": number, "subsets": []})
+
+    names = lambda **params: [n["name"] for n in client.get("/api/exercise-names", params=params).json()]
+    assert names(prefix="ben") == ["Bench Press", "Benchmark Squat", "Bent Over Row"]
+    assert names(prefix="BENCH ") == ["Bench Press"]
+    assert names(prefix="ben", limit=1) == ["Bench Press"]
+    assert names(prefix="x") == []
+    assert len(names()) == 7
+
+
+def test_rolled_back_names_not_indexed():
+    failing = TestClient(app, raise_server_exceptions=False)
+    workout = {"user_id": 999, "exercises": [{"exercise_number": 1, "sets": [{"exercise_name": "Phantom Lift", "set_number": 1}]}]}
+    assert failing.post("/api/workouts", json=workout).status_code == 500
+
+    names = lambda prefix: [n["name"] for n in client.get("/api/exercise-names", params={"prefix": prefix}).json()]
+    assert names("phan") == []
+
+    # SQLite may hand the rolled back id out again, the real name must still be found under it
+    workout = {"user_id": 1, "exercises": [{"exercise_number": 1, "sets": [{"exercise_name": "Real Squat", "set_number": 1}]}]}
+    assert client.post("/api/workouts", json=workout).status_code == 200
+    assert names("real") == ["Real Squat"]
+
+
+def test_progress_matches_catalog_spelling(data):
+    create_workout(data)
+
+    response = client.get("/api/users/1/progress", params={"exercise": "bench press"})
+    assert len(response.json()["workouts"]) == 1
+
+
+def test_name_index():
+    index = NameIndex()
+    for id, name in enumerate(["Squat", "Squat Jump", "Split Squat", "Sumo Deadlift"], start=1):
+        index.add(id, name)
+    index.add(1, "Squat")
+
+    assert index.search("s", 10) == [(3, "Split Squat"), (1, "Squat"), (2, "Squat Jump"), (4, "Sumo Deadlift")]
+    assert index.search("squat", 10) == [(1, "Squat"), (2, "Squat Jump")]
+    assert index.search("squat ", 10) == [(2, "Squat Jump")]
@@ -0,0 +1,105 @@
+from fastapi.testclient import TestClient
+from main import app
+from ws_manager import websocket_manager
+from database import engine
+import api.changes
+import changelog
+from tests.util import create_workout, retrieve_workout, subscribe_and_listen
+import pytest
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def data():
+    return retrieve_workout()
+
+
+def changes(resource, **params):
+    response = client.get("/api/changes", params={"resource": resource, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_broadcasts_carry_sequence_numbers(data):
+    workout = create_workout(data)
+    exercise_id = workout["exercises"][0]["id"]
+    with subscribe_and_listen(f"workouts:{workout['id']}") as ws:
+        client.post("/api/sets", json={"exercise_id": exercise_id, "exercise_name": "Dips", "set_number": 4, "subsets": []})
+        client.post("/api/sets", json={"exercise_id": exercise_id, "exercise_name": "Dips", "set_number": 5, "subsets": []})
+        first, second = ws.receive_json(), ws.receive_json()
+
+    assert first["type"] == second["type"] == "set_created"
+    assert second["seq"] > first["seq"]
+
+
+def test_changes_since(data):
+    workout = create_workout(data)
+    set_id = workout["exercises"][0]["sets"][0]["id"]
+    for number in range(2, 5):
+        client.post("/api/subsets", json={"set_id": set_id, "reps": 1, "weight": 50.0, "subset_number": number})
+
+    everything = changes(f"workouts:{workout['id']}")
+    assert [e["type"] for e in everything["events"]] == ["workout_created"] + ["subset_created"] * 3
+    assert all(e["resource"] == f"workouts:{workout['id']}" for e in everything["events"])
+    assert everything["latest"] == everything["events"][-1]["seq"]
+
+    since = everything["events"][1]["seq"]
+    delta = changes(f"workouts:{workout['id']}", since=since)
+    assert [e["seq"] for e in delta["events"]] == [e["seq"] for e in everything["events"][2:]]
+    assert changes(f"workouts:{workout['id']}", since=delta["latest"])["events"] == []
+
+
+def test_changes_fall_back_to_change_log(data):
+    workout = create_workout(data)
+    client.post("/api/exercises", json={"workout_id": workout["id"], "exercise_number": 3, "sets": []})
+    from_history = changes("users:1")
+
+    websocket_manager.history.clear()
+    assert changes("users:1") == from_history
+    assert [e["type"] for e in from_history["events"] if e["type"] != "personal_record"] == ["workout_created", "exercise_created"]
+
+
+def test_changes_paginate(data):
+    for _ in range(3):
+        create_workout(data)
+
+    everything = changes("users:1")["events"]
+    paged, since, more = [], 0, True
+    while more:
+        page = changes("users:1", since=since, limit=2)
+        assert len(page["events"]) == 2 or not page["more"]
+        paged += page["events"]
+        since, more = page["latest"], page["more"]
+
+    assert paged == everything
+    assert len([e for e in paged if e["type"] == "workout_created"]) == 3
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="SQLite commits sequence numbers in order")
+def test_changes_hold_back_unsettled_events(data, monkeypatch):
+    workout = create_workout(data)
+    resource = f"workouts:{workout['id']}"
+    monkeypatch.setattr(api.changes, "CHANGES_SETTLE_SECONDS", 60)
+    held = changes(resource)
+    assert held["events"] == [] and held["more"] and held["latest"] == 0
+
+    monkeypatch.setattr(api.changes, "CHANGES_SETTLE_SECONDS", 0)
+    assert [e["type"] for e in changes(resource)["events"]] == ["workout_created"]
+
+
+def test_pruned_changes_ask_for_reload(data):
+    for _ in range(3):
+        create_workout(data)
+    seqs = [e["seq"] for e in changes("users:1")["events"]]
+
+    assert changelog.prune(engine, days=None, count=2) == seqs[-1] - 2
+    websocket_manager.history.clear()
+
+    response = client.get("/api/changes", params={"resource": "users:1"})
+    assert response.status_code == 410
+    assert [e["seq"] for e in changes("users:1", since=seqs[-3])["events"]] == seqs[-2:]
+
+    # By age, the newest change is always kept
+    assert changelog.prune(engine, days=0, count=None) == 1
+    assert client.get("/api/changes", params={"resource": "users:1", "since": seqs[-3]}).status_code == 410
+    assert [e["seq"] for e in changes("users:1", since=seqs[-2])["events"]] == seqs[-1:]
@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from database import engine_options, with_driver
+from main import app
+
+client = TestClient(app)
+
+
+def test_with_driver():
+    assert with_driver("postgresql://u:p@db/app", sync=True).drivername == "postgresql+psycopg2"
+    assert with_driver("postgresql://u:p@db/app", sync=False).drivername == "postgresql+asyncpg"
+    assert with_driver("sqlite:///app.db", sync=False).drivername == "sqlite+aiosqlite"
+
+
+def test_engine_options_from_env():
+    url = make_url("postgresql+asyncpg://u:p@db/app")
+    options = engine_options(url, env={
+        "DB_POOL_SIZE": "20",
+        "DB_MAX_OVERFLOW": "5",
+        "DB_POOL_TIMEOUT": "2.5",
+        "DB_POOL_RECYCLE": "600",
+        "DB_POOL_PRE_PING": "false",
+        "DB_STATEMENT_TIMEOUT_MS": "5000",
+    })
+
+    assert options == {
+        "pool_pre_ping": False,
+        "pool_size": 20,
+        "max_overflow": 5,
+        "pool_timeout": 2.5,
+        "pool_recycle": 600,
+        "connect_args": {"server_settings": {"statement_timeout": "5000"}},
+    }
+
+
+def test_engine_options_null_pool():
+    options = engine_options(make_url("postgresql+asyncpg://u:p@db/app"), env={"DB_POOL_CLASS": "null"})
+    assert options["poolclass"] is NullPool
+    assert "pool_size" not in options
+
+
+def test_pool_stats_endpoint():
+    client.get("/api/users")
+
+    response = client.get("/db/stats")
+    assert response.status_code == 200
+
+    stats = response.json()
+    assert stats["pool"] == "NullPool"
+    assert stats["checkouts"] >= 1
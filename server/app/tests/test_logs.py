@@ -0,0 +1,58 @@
+from fastapi.testclient import TestClient
+from main import app
+from logs import JsonFormatter, RecordQueueHandler, SamplingFilter, request_id
+from tests.util import create_workout, retrieve_workout
+import json
+import logging
+import queue
+import pytest
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def data():
+    return retrieve_workout()
+
+
+def test_request_id_is_echoed_or_assigned():
+    assert client.get("/", headers={"X-Request-ID": "abc123"}).headers["X-Request-ID"] == "abc123"
+    first, second = client.get("/").headers["X-Request-ID"], client.get("/").headers["X-Request-ID"]
+    assert first and first != second
+
+
+def test_records_carry_the_request_id(data, caplog):
+    caplog.set_level(logging.DEBUG, logger="api.workouts")
+    workout = create_workout(data)
+    client.post("/api/exercises", headers={"X-Request-ID": "req-1"}, json={"workout_id": workout["id"], "exercise_number": 2, "sets": []})
+
+    record = next(r for r in caplog.records if r.getMessage() == "exercise_created broadcast")
+    assert record.request_id == "req-1"
+    assert record.resources[-1] == "users:1"
+
+
+def test_queued_records_format_as_json():
+    records = queue.SimpleQueue()
+    logger = logging.getLogger("tests.logs")
+    logger.propagate = False
+    handler = RecordQueueHandler(records)
+    handler.addFilter(SamplingFilter(0))
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+    token = request_id.set("req-2")
+    try:
+        logger.debug("dropped by sampling")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Failed for %s", "users:1", extra={"resources": ["users:1"]})
+    finally:
+        request_id.reset(token)
+        logger.removeHandler(handler)
+
+    entry = json.loads(JsonFormatter().format(records.get_nowait()))
+    assert records.empty()
+    assert entry["message"] == "Failed for users:1"
+    assert entry["level"] == "ERROR" and entry["request_id"] == "req-2"
+    assert entry["resources"] == ["users:1"]
+    assert "ValueError: boom" in entry["exc"]
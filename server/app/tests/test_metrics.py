@@ -0,0 +1,74 @@
+from fastapi.testclient import TestClient
+from main import app
+from tests.util import create_workout, retrieve_workout
+import metrics
+import pytest
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def data():
+    return retrieve_workout()
+
+@pytest.fixture(autouse=True)
+def clear_histograms():
+    for histogram in (metrics.request_seconds, metrics.request_queries, metrics.request_query_seconds):
+        histogram.clear()
+
+
+def sample(samples, name, route, **labels):
+    # Route templates may or may not carry the router prefix, depending on the FastAPI version
+    for key, value in samples.items():
+        if key.startswith(name + "{") and route in key and all(f'{k}="{v}"' in key for k, v in labels.items()):
+            return value
+    raise KeyError(f"{name} {route} {labels}")
+
+
+def scrape():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for line in response.text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_request_latency_by_route_template(data):
+    workout = create_workout(data)
+    for _ in range(3):
+        assert client.get(f"/api/workouts/{workout['id']}").status_code == 200
+    client.get("/api/workouts/999999")
+
+    samples = scrape()
+    route = '/workouts/{id}"'
+    assert sample(samples, "http_request_duration_seconds_count", route, method="GET", status=200) == 3
+    assert sample(samples, "http_request_duration_seconds_count", route, method="GET", status=404) == 1
+    assert sample(samples, "http_request_duration_seconds_bucket", route, method="GET", status=200, le="+Inf") == 3
+
+
+def test_queries_are_counted_per_request(data):
+    create_workout(data)
+    samples = scrape()
+    route = '/workouts"'
+    assert sample(samples, "http_request_db_queries_count", route, method="POST") == 1
+    assert sample(samples, "http_request_db_queries_sum", route, method="POST") >= 3
+    assert sample(samples, "http_request_db_seconds_sum", route, method="POST") > 0
+    assert samples["db_queries_total"] >= sample(samples, "http_request_db_queries_sum", route, method="POST")
+
+
+def test_websocket_gauges(data):
+    workout = create_workout(data)
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "subscribe", "resource": f"workouts:{workout['id']}"})
+        ws.receive_json()
+        before = scrape()
+        client.post("/api/exercises", json={"workout_id": workout["id"], "exercise_number": 2, "sets": []})
+        ws.receive_json()
+        after = scrape()
+
+    assert before["ws_connections"] >= 1 and before["ws_subscriptions"] >= 1
+    assert after["ws_fanout_total"] == before["ws_fanout_total"] + 1
+    assert after["ws_send_duration_seconds_count"] > 0
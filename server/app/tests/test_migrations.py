@@ -0,0 +1,114 @@
+from sqlalchemy import create_engine, inspect, text
+from database import engine, Base
+from migrations import upgrade, load_migrations, current_version
+import pytest
+
+
+@pytest.fixture
+def fresh_engine(tmp_path):
+    fresh = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield fresh
+    fresh.dispose()
+
+
+def schema_of(target_engine):
+    inspector = inspect(target_engine)
+    tables = set(inspector.get_table_names()) - {"SchemaVersions"}
+    return {
+        table: (
+            {column["name"] for column in inspector.get_columns(table)},
+            {index["name"] for index in inspector.get_indexes(table)},
+        )
+        for table in tables
+    }
+
+
+def test_migrations_match_models(fresh_engine, tmp_path):
+    upgrade(fresh_engine)
+
+    model_engine = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    Base.metadata.create_all(model_engine)
+
+    assert schema_of(fresh_engine) == schema_of(model_engine)
+    model_engine.dispose()
+
+
+def test_upgrade_existing_database_in_place(fresh_engine):
+    upgrade(fresh_engine, target=1)
+    with fresh_engine.begin() as conn:
+        conn.execute(text('INSERT INTO "Users" (id, name) VALUES (1, \'Existing User\')'))
+        conn.execute(text('INSERT INTO "Workouts" (id, user_id) VALUES (1, 1)'))
+
+    latest = load_migrations()[-1][0]
+    applied = upgrade(fresh_engine)
+    assert applied == list(range(2, latest + 1))
+    assert upgrade(fresh_engine) == []
+
+    with fresh_engine.connect() as conn:
+        assert current_version(conn) == latest
+        assert conn.execute(text('SELECT user_id FROM "Workouts" WHERE id = 1')).scalar_one() == 1
+
+    index_names = {index["name"] for index in inspect(fresh_engine).get_indexes("Workouts")}
+    assert "ix_Workouts_user_id_id" in index_names
+
+
+@pytest.mark.parametrize("query, index", [
+    ('SELECT id FROM "Workouts" WHERE user_id = 1 ORDER BY id DESC', "ix_Workouts_user_id_id"),
+    ('SELECT id FROM "Exercises" WHERE workout_id = 1 ORDER BY exercise_number', "ix_Exercises_workout_id_exercise_number"),
+    ('SELECT id FROM "Sets" WHERE exercise_id = 1 ORDER BY set_number', "ix_Sets_exercise_id_set_number"),
+    ('SELECT id FROM "Subsets" WHERE set_id = 1 ORDER BY subset_number', "ix_Subsets_set_id_subset_number"),
+])
+def test_child_lookups_use_index(query, index):
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # Tables are tiny in tests, so force the planner away from sequential scans
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            plan = "\n".join(row[0] for row in conn.execute(text(f"EXPLAIN {query}")))
+        else:
+            plan = "\n".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}")))
+
+    assert index in plan
+
+
+def test_exercise_names_deduplicated(fresh_engine):
+    upgrade(fresh_engine, target=4)
+    with fresh_engine.begin() as conn:
+        conn.execute(text('INSERT INTO "Users" (id, name) VALUES (1, \'Existing User\')'))
+        conn.execute(text('INSERT INTO "Workouts" (id, user_id) VALUES (1, 1)'))
+        conn.execute(text('INSERT INTO "Exercises" (id, workout_id, exercise_number) VALUES (1, 1, 1)'))
+        for set_id, name in enumerate(["Bench Press", "bench press", "Bench  Press ", "Bench Press", "Squat"], start=1):
+            conn.execute(text('INSERT INTO "Sets" (id, exercise_id, exercise_name, set_number) VALUES (:id, 1, :name, :id)'), {"id": set_id, "name": name})
+            conn.execute(text('INSERT INTO "Subsets" (set_id, reps, weight, subset_number) VALUES (:id, 5, :weight, 1)'), {"id": set_id, "weight": 100.0 + set_id})
+
+    upgrade(fresh_engine)
+
+    with fresh_engine.connect() as conn:
+        names = dict(conn.execute(text('SELECT name, id FROM "ExerciseNames"')).all())
+        assert set(names) == {"Bench Press", "Squat"}
+
+        set_names = conn.execute(text('SELECT id, exercise_name_id FROM "Sets" ORDER BY id')).all()
+        assert [name_id for _, name_id in set_names] == [names["Bench Press"]] * 4 + [names["Squat"]]
+
+        records = dict(conn.execute(text('SELECT exercise_name_id, top_weight FROM "PersonalRecords"')).all())
+        assert records == {names["Bench Press"]: 104.0, names["Squat"]: 105.0}
+
+
+def test_deletes_cascade_after_upgrade(fresh_engine):
+    upgrade(fresh_engine, target=7)
+    with fresh_engine.begin() as conn:
+        conn.execute(text('INSERT INTO "Users" (id, name) VALUES (1, \'Existing User\')'))
+        conn.execute(text('INSERT INTO "Workouts" (id, user_id) VALUES (1, 1)'))
+        conn.execute(text('INSERT INTO "ExerciseNames" (id, name, normalized) VALUES (1, \'Squat\', \'squat\')'))
+        conn.execute(text('INSERT INTO "Exercises" (id, workout_id, exercise_number) VALUES (1, 1, 1)'))
+        conn.execute(text('INSERT INTO "Sets" (id, exercise_id, exercise_name_id, set_number) VALUES (1, 1, 1, 1)'))
+        conn.execute(text('INSERT INTO "Subsets" (id, set_id, reps, weight, subset_number) VALUES (1, 1, 5, 100.0, 1)'))
+
+    upgrade(fresh_engine)
+
+    with fresh_engine.connect() as conn:
+        conn.execute(text("PRAGMA foreign_keys = ON"))
+        assert conn.execute(text('SELECT count(*) FROM "Subsets"')).scalar_one() == 1
+        conn.execute(text('DELETE FROM "Workouts" WHERE id = 1'))
+        for table in ("Exercises", "Sets", "Subsets"):
+            assert conn.execute(text(f'SELECT count(*) FROM "{table}"')).scalar_one() == 0
+        conn.commit()
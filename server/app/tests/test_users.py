@@ -24,3 +24,15 @@ def test_create_and_get_user():
     created_user = next((user for user in users if user["id"] == create_data["id"]),None)
     assert created_user is not None
     assert created_user["name"] == user_data["name"]
+
+
+def test_users_conditional_get():
+    first = client.get("/api/users")
+    etag = first.headers["ETag"]
+    assert client.get("/api/users", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/api/users", json={"name": "Another User"})
+
+    modified = client.get("/api/users", headers={"If-None-Match": etag})
+    assert modified.status_code == 200
+    assert len(modified.json()) == 2
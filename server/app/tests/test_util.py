@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from database import async_engine, AsyncSessionLocal
+from api.util import get_all_parents, clear_parent_cache, parent_cache
+from schemas.workouts import Exercise
+from api.cache import ResponseCache, body_etag
+from tests.util import create_workout, retrieve_workout
+import asyncio
+import pytest
+
+@pytest.fixture(scope="module")
+def data():
+    return retrieve_workout()
+
+@contextmanager
+def count_queries():
+    queries = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield queries
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+def test_get_all_parents_single_query(data):
+    workout_data = create_workout(data)
+    subset_id = workout_data["exercises"][0]["sets"][0]["subsets"][0]["id"]
+    clear_parent_cache()
+
+    async def resolve():
+        async with AsyncSessionLocal() as db:
+            with count_queries() as queries:
+                resources = await get_all_parents(db=db, child_type="subsets", child_id=subset_id)
+        return resources, queries
+
+    resources, queries = asyncio.run(resolve())
+
+    assert len(queries) == 1
+    assert resources == [
+        f"subsets:{subset_id}",
+        f"sets:{workout_data['exercises'][0]['sets'][0]['id']}",
+        f"exercises:{workout_data['exercises'][0]['id']}",
+        f"workouts:{workout_data['id']}",
+        "users:1",
+    ]
+
+
+def test_get_all_parents_cached(data):
+    workout_data = create_workout(data)
+    subset_id = workout_data["exercises"][0]["sets"][0]["subsets"][0]["id"]
+
+    async def resolve_twice():
+        async with AsyncSessionLocal() as db:
+            expected = await get_all_parents(db=db, child_type="subsets", child_id=subset_id)
+
+            with count_queries() as queries:
+                assert await get_all_parents(db=db, child_type="subsets", child_id=subset_id) == expected
+                assert await get_all_parents(db=db, child_type="workouts", child_id=workout_data["id"]) == expected[3:]
+        return queries
+
+    assert len(asyncio.run(resolve_twice())) == 0
+
+
+def test_get_all_parents_caches_on_commit_only(data):
+    workout_data = create_workout(data)
+    clear_parent_cache()
+
+    async def resolve(commit):
+        async with AsyncSessionLocal() as db:
+            exercise = Exercise(workout_id=workout_data["id"], exercise_number=9)
+            db.add(exercise)
+            await db.flush()
+            resources = await get_all_parents(db=db, child_type="exercises", child_id=exercise.id)
+            await (db.commit() if commit else db.rollback())
+        return resources
+
+    asyncio.run(resolve(commit=False))
+    assert len(parent_cache) == 0
+
+    committed = asyncio.run(resolve(commit=True))
+    assert parent_cache[committed[0]] == f"workouts:{workout_data['id']}"
+    assert parent_cache[f"workouts:{workout_data['id']}"] == "users:1"
+
+
+def test_get_all_parents_missing_row():
+    async def resolve():
+        async with AsyncSessionLocal() as db:
+            await get_all_parents(db=db, child_type="sets", child_id=999)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(resolve())
+
+
+def test_response_cache_skips_stale_load():
+    cache = ResponseCache()
+
+    async def load_during_write():
+        cache.invalidate(["workouts:1"]) # a write lands while the tree is being read
+        return '{"id": 1}'
+
+    assert asyncio.run(cache.get_or_load("workouts:1", load_during_write)) == ('{"id": 1}', body_etag('{"id": 1}'))
+    assert cache.get("workouts:1") is None
+
+
+def test_response_cache_lru_and_ttl():
+    cache = ResponseCache(max_size=2, ttl=60)
+    for key in ("sets:1", "sets:2", "sets:3"):
+        cache.put(key, "{}", '"etag"', cache.epoch)
+
+    assert cache.get("sets:1") is None
+    assert cache.get("sets:3") == ("{}", '"etag"')
+
+    expired = ResponseCache(ttl=-1)
+    expired.put("sets:1", "{}", '"etag"', expired.epoch)
+    assert expired.get("sets:1") is None
@@ -0,0 +1,354 @@
+from ws_manager import WebSocketManager, LocalBackend, PostgresBackend, EventHistory, encode_event
+from ws_manager.backends import split_utf8
+from database import engine
+from sqlalchemy import text
+import asyncio
+import json
+import pytest
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        self.sent.append(frame)
+
+    @property
+    def messages(self):
+        return [json.loads(frame) for frame in self.sent]
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+class BrokenWebSocket(FakeWebSocket):
+    async def send_text(self, frame):
+        raise RuntimeError("connection lost")
+
+
+class StalledWebSocket(FakeWebSocket):
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def send_text(self, frame):
+        await self.release.wait()
+        self.sent.append(frame)
+
+
+async def connect(manager, websocket, *resources):
+    await manager.connect(websocket)
+    for resource in resources:
+        manager.subscribe(websocket=websocket, resource=resource)
+    return websocket
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_broadcast_only_reaches_subscribers():
+    async def scenario():
+        manager = WebSocketManager()
+        listener = await connect(manager, FakeWebSocket(), "users:1")
+        idle = await connect(manager, FakeWebSocket(), "users:2")
+
+        await manager.broadcast(resource="users:1", data={"type": "workout_created"})
+        await settle()
+
+        assert listener.messages == [{"type": "workout_created", "resource": "users:1"}]
+        assert idle.sent == []
+
+    asyncio.run(scenario())
+
+
+def test_unsubscribe_and_disconnect_clean_index():
+    async def scenario():
+        manager = WebSocketManager()
+        ws = await connect(manager, FakeWebSocket(), "users:1", "workouts:1")
+
+        manager.unsubscribe(websocket=ws, resource="users:1")
+        assert "users:1" not in manager.subscribers
+        assert manager.subscribers["workouts:1"] == {ws}
+
+        with pytest.raises(ValueError):
+            manager.unsubscribe(websocket=ws, resource="users:1")
+
+        await manager.disconnect(ws)
+        assert manager.subscribers == {}
+        assert manager.subscriptions == {}
+        assert ws not in manager.active_connections
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_drops_failed_connections():
+    async def scenario():
+        manager = WebSocketManager()
+        broken = await connect(manager, BrokenWebSocket(), "users:1")
+        listener = await connect(manager, FakeWebSocket(), "users:1")
+
+        await manager.broadcast(resource="users:1", data={"type": "workout_created"})
+        await settle()
+
+        assert broken not in manager.active_connections
+        assert manager.subscribers["users:1"] == {listener}
+        assert len(listener.sent) == 1
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_drops_oldest_without_stalling_others():
+    async def scenario():
+        manager = WebSocketManager(max_queue=3)
+        slow = await connect(manager, StalledWebSocket(), "users:1")
+        fast = await connect(manager, FakeWebSocket(), "users:1")
+
+        for i in range(10):
+            await manager.broadcast(resource="users:1", data={"type": "workout_created", "n": i})
+            await settle()
+
+        assert [m["n"] for m in fast.messages] == list(range(10))
+        assert manager.stats()["dropped"] == 6 # one in flight, three queued
+
+        slow.release.set()
+        await settle()
+        assert [m["n"] for m in slow.messages] == [0, 7, 8, 9]
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_disconnect_policy():
+    async def scenario():
+        manager = WebSocketManager(max_queue=2, overflow_policy="disconnect")
+        slow = await connect(manager, StalledWebSocket(), "users:1")
+
+        for i in range(5):
+            await manager.broadcast(resource="users:1", data={"type": "workout_created", "n": i})
+        await settle()
+
+        assert slow not in manager.active_connections
+        assert slow.closed_with == 1013
+        assert manager.stats()["evicted"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_many_encodes_once():
+    async def scenario():
+        manager = WebSocketManager()
+        first = await connect(manager, FakeWebSocket(), "workouts:1", "users:1")
+        second = await connect(manager, FakeWebSocket(), "users:1")
+
+        payload = encode_event("workout_created", {"user_id": 1, "exercises": []})
+        await manager.broadcast_many(resources=["workouts:1", "users:1"], data=payload)
+        await settle()
+
+        assert sorted(m["resource"] for m in first.messages) == ["users:1", "workouts:1"]
+        assert first.messages[0]["data"] == {"user_id": 1, "exercises": []}
+
+        # Subscribers of the same resource share one frame object
+        users_frame = next(f for f in first.sent if f.endswith('"users:1"}'))
+        assert users_frame is second.sent[0]
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_reaches_other_workers():
+    async def scenario():
+        bus = LocalBackend()
+        worker_a = WebSocketManager(backend=bus)
+        worker_b = WebSocketManager(backend=bus)
+        on_a = await connect(worker_a, FakeWebSocket(), "users:1")
+        on_b = await connect(worker_b, FakeWebSocket(), "users:1")
+
+        await worker_a.broadcast(resource="users:1", data={"type": "workout_created"})
+        await settle()
+
+        assert on_a.messages == on_b.messages == [{"type": "workout_created", "resource": "users:1"}]
+
+    asyncio.run(scenario())
+
+
+def test_split_utf8_keeps_characters_whole():
+    text = "ø" * 10 + "a" * 5
+    chunks = split_utf8(text, 7)
+
+    assert "".join(chunks) == text
+    assert all(len(chunk.encode()) <= 7 for chunk in chunks)
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="requires Postgres LISTEN/NOTIFY")
+def test_postgres_backend_across_workers():
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    async def scenario():
+        worker_a = WebSocketManager(backend=PostgresBackend(dsn=dsn, channel="ws_test"))
+        worker_b = WebSocketManager(backend=PostgresBackend(dsn=dsn, channel="ws_test"))
+        await worker_a.start()
+        await worker_b.start()
+        try:
+            on_b = await connect(worker_b, FakeWebSocket(), "users:1")
+
+            # Larger than a single NOTIFY payload
+            exercises = [{"exercise_number": i, "sets": []} for i in range(500)]
+            await worker_a.broadcast(resource="users:1", data=encode_event("workout_created", {"exercises": exercises}))
+
+            for _ in range(50):
+                if on_b.sent:
+                    break
+                await asyncio.sleep(0.1)
+
+            assert on_b.messages[0]["data"]["exercises"] == exercises
+            assert on_b.messages[0]["resource"] == "users:1"
+        finally:
+            await worker_a.stop()
+            await worker_b.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="requires Postgres LISTEN/NOTIFY")
+def test_postgres_backend_reconnects():
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    async def scenario():
+        backend = PostgresBackend(dsn=dsn, channel="ws_reconnect_test")
+        manager = WebSocketManager(backend=backend)
+        await manager.start()
+        try:
+            ws = await connect(manager, FakeWebSocket(), "users:1")
+            with engine.connect() as conn:
+                for connection in (backend.listener, backend.publisher):
+                    conn.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": connection.info.backend_pid})
+
+            # The first publish finds the dead publisher; it is counted, not raised
+            await manager.broadcast(resource="users:1", data={"type": "lost"})
+            for attempt in range(50):
+                await manager.broadcast(resource="users:1", data={"type": "workout_created", "attempt": attempt})
+                await asyncio.sleep(0.2)
+                if ws.sent:
+                    break
+
+            assert ws.messages[0]["type"] == "workout_created"
+            assert manager.stats()["publish_failures"] >= 1
+            assert backend.reconnects >= 2
+        finally:
+            await manager.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_publish_is_counted_not_raised():
+    class FailingBackend(LocalBackend):
+        async def publish(self, resources, payload):
+            raise ConnectionError("bus down")
+
+    async def scenario():
+        manager = WebSocketManager(backend=FailingBackend())
+        await manager.broadcast(resource="users:1", data={"type": "workout_created"})
+        assert manager.stats()["publish_failures"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_history_orders_by_sequence():
+    history = EventHistory(max_events=3)
+    for seq in (1, 3, 2, 3, 4):
+        history.record(["users:1"], seq, f"event {seq}")
+
+    assert [seq for seq, _ in history.since("users:1", 1)] == [2, 3, 4]
+    # Sequence 1 fell out of the buffer, so it can no longer vouch for everything after 0
+    assert history.since("users:1", 0) is None
+    # Nothing happened on users:2 since the history started
+    assert history.since("users:2", 0) == []
+
+
+def test_history_only_vouches_for_what_it_saw():
+    history = EventHistory(max_resources=1)
+    assert history.since("users:1", 0) is None
+
+    history.record(["users:1"], 10, "event 10")
+    assert history.since("users:1", 9) == [(10, "event 10")]
+    assert history.since("users:1", 8) is None
+
+    history.record(["users:2"], 11, "event 11")
+    assert history.since("users:1", 9) is None
+    assert history.since("users:1", 10) == []
+
+
+def test_subscribe_since_replays_before_live():
+    async def scenario():
+        manager = WebSocketManager()
+        for seq in (1, 2, 3):
+            await manager.broadcast(resource="sets:1", data=encode_event("subset_created", {"n": seq}, seq=seq))
+
+        ws = await connect(manager, FakeWebSocket())
+        assert manager.subscribe(websocket=ws, resource="sets:1", since=1) == 2
+        await manager.broadcast(resource="sets:1", data=encode_event("subset_created", {"n": 4}, seq=4))
+        await settle()
+
+        assert [m["seq"] for m in ws.messages] == [2, 3, 4]
+        assert all(m["resource"] == "sets:1" for m in ws.messages)
+
+        manager.history.clear()
+        late = await connect(manager, FakeWebSocket())
+        assert manager.subscribe(websocket=late, resource="sets:1", since=3) is None
+
+    asyncio.run(scenario())
+
+
+def test_replay_does_not_hold_up_other_subscribers():
+    async def scenario():
+        manager = WebSocketManager()
+        for seq in range(1, 51):
+            await manager.broadcast(resource="users:1", data=encode_event("workout_created", {}, seq=seq))
+
+        stalled = await connect(manager, StalledWebSocket())
+        manager.subscribe(websocket=stalled, resource="users:1", since=0)
+        live = await connect(manager, FakeWebSocket(), "users:1")
+
+        await manager.broadcast(resource="users:1", data=encode_event("workout_created", {}, seq=51))
+        await settle()
+        assert [m["seq"] for m in live.messages] == [51]
+
+        stalled.release.set()
+        await settle()
+        assert [m["seq"] for m in stalled.messages] == list(range(1, 52))
+
+    asyncio.run(scenario())
+
+
+def test_coalescing_batches_events_per_resource():
+    async def scenario():
+        manager = WebSocketManager()
+        batched = await connect(manager, FakeWebSocket())
+        manager.subscribe(websocket=batched, resource="sets:1", coalesce_ms=50)
+        manager.subscribe(websocket=batched, resource="users:1")
+        plain = await connect(manager, FakeWebSocket(), "sets:1")
+
+        for n in range(3):
+            await manager.broadcast_many(resources=["sets:1", "users:1"], data={"type": "subset_created", "n": n})
+        await settle()
+        assert [m["resource"] for m in batched.messages] == ["users:1"] * 3
+        assert len(plain.messages) == 3
+
+        await asyncio.sleep(0.08)
+        batch = batched.messages[-1]
+        assert batch["type"] == "batch" and batch["resource"] == "sets:1"
+        assert [e["n"] for e in batch["events"]] == [0, 1, 2]
+        assert manager.stats()["coalesced"] == 3
+
+        # A lone event in its window goes out as a plain frame, unsubscribing flushes what is held
+        await manager.broadcast(resource="sets:1", data={"type": "subset_created", "n": 3})
+        manager.unsubscribe(websocket=batched, resource="sets:1")
+        await settle()
+        assert batched.messages[-1] == {"type": "subset_created", "n": 3, "resource": "sets:1"}
+
+    asyncio.run(scenario())
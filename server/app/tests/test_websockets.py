@@ -1,6 +1,7 @@
 from tests.util import create_workout, subscribe_and_listen, retrieve_workout
 from fastapi.testclient import TestClient
 from main import app
+from ws_manager import websocket_manager
 import pytest
 
 client = TestClient(app)
@@ -148,3 +149,80 @@ def test_subset_created_set_broadcast(data):
     assert message["data"]["set_id"] == created["set_id"]
     assert message["resource"] == f"sets:{set_id}"
 
+
+
+def test_bulk_import_user_broadcast(data):
+    with subscribe_and_listen("users:1") as ws:
+        result = client.post("/api/workouts/bulk", json=[data["workout"]] * 2).json()
+        message = ws.receive_json()
+
+    assert message["type"] == "workouts_imported"
+    assert message["data"]["workout_ids"] == result["workout_ids"]
+    assert message["resource"] == "users:1"
+
+
+# ---------- Resume ----------
+
+
+def test_resubscribe_since_replays_missed_events(data):
+    with subscribe_and_listen("users:1") as ws:
+        seen = create_workout(data)
+        last_seq = ws.receive_json()["seq"]
+
+    set_id = seen["exercises"][0]["sets"][0]["id"]
+    for number in (2, 3):
+        client.post("/api/subsets", json={"set_id": set_id, "reps": 5, "weight": 20.0, "subset_number": number})
+
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "subscribe", "resource": f"sets:{set_id}", "since": last_seq})
+        replayed = [ws.receive_json(), ws.receive_json()]
+        ack = ws.receive_json()
+
+        assert [m["type"] for m in replayed] == ["subset_created", "subset_created"]
+        assert replayed[0]["seq"] < replayed[1]["seq"]
+        assert ack == {"type": "subscribed", "resource": f"sets:{set_id}", "replayed": 2}
+
+        client.post("/api/subsets", json={"set_id": set_id, "reps": 5, "weight": 20.0, "subset_number": 4})
+        assert ws.receive_json()["seq"] > replayed[1]["seq"]
+
+
+def test_resubscribe_beyond_history(data):
+    create_workout(data)
+    websocket_manager.history.clear()
+
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "subscribe", "resource": "users:1", "since": 0})
+        assert ws.receive_json() == {"type": "subscribed", "resource": "users:1", "replayed": None}
+
+        ws.send_json({"type": "subscribe", "resource": "users:1", "since": "yesterday"})
+        assert ws.receive_json()["type"] == "error"
+
+        ws.send_json({"type": "subscribe", "resource": "users:1", "since": True})
+        assert ws.receive_json()["type"] == "error"
+
+
+# ---------- Coalescing ----------
+
+
+def test_coalesced_subscription_batches_bursts(data):
+    workout_data = create_workout(data)
+    set_id = workout_data["exercises"][0]["sets"][0]["id"]
+
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "subscribe", "resource": f"sets:{set_id}", "coalesce_ms": 500})
+        assert ws.receive_json() == {"type": "subscribed", "resource": f"sets:{set_id}", "coalesce_ms": 500}
+
+        for number in (2, 3, 4):
+            client.post("/api/subsets", json={"set_id": set_id, "reps": 5, "weight": 20.0, "subset_number": number})
+        batch = ws.receive_json()
+
+    assert batch["type"] == "batch" and batch["resource"] == f"sets:{set_id}"
+    assert [e["type"] for e in batch["events"]] == ["subset_created"] * 3
+    assert [e["data"]["subset_number"] for e in batch["events"]] == [2, 3, 4]
+
+
+def test_coalesce_window_is_validated():
+    with client.websocket_connect("/ws") as ws:
+        for window in (-1, 10_000, "soon", True):
+            ws.send_json({"type": "subscribe", "resource": "users:1", "coalesce_ms": window})
+            assert ws.receive_json()["type"] == "error"
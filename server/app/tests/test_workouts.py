@@ -2,6 +2,11 @@ from fastapi.testclient import TestClient
 from main import app
 from tests.util import create_workout
 from tests.util import retrieve_workout
+from tests.util import subscribe_and_listen
+from database import engine
+from rollups import rebuild
+from api.cache import response_cache
+import json
 import pytest
 
 client = TestClient(app)
@@ -176,3 +181,339 @@ def test_get_all_workouts_after_creation(data):
 
     workout_data = response.json()
     assert len(workout_data) == 1
+
+
+def test_get_workouts_paginated(data):
+    created_ids = [create_workout(data)["id"] for _ in range(3)]
+
+    first_page = client.get("/api/workouts", params={"limit": 2})
+    assert first_page.status_code == 200
+    assert [w["id"] for w in first_page.json()] == created_ids[::-1][:2]
+
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get("/api/workouts", params={"limit": 2, "cursor": cursor})
+    assert second_page.status_code == 200
+    assert [w["id"] for w in second_page.json()] == created_ids[:1]
+    assert "X-Next-Cursor" not in second_page.headers
+
+
+def test_get_workouts_filtered_by_user(data):
+    create_workout(data)
+    client.post("/api/users", json={"name": "Other User"})
+    create_workout({"workout": {**data["workout"], "user_id": 2}})
+
+    response = client.get("/api/workouts", params={"user_id": 2})
+    assert response.status_code == 200
+
+    workouts = response.json()
+    assert len(workouts) == 1
+    assert workouts[0]["user_id"] == 2
+
+
+def test_get_workouts_summary(data):
+    create_workout(data)
+
+    response = client.get("/api/workouts", params={"summary": True})
+    assert response.status_code == 200
+
+    workout = response.json()[0]
+    assert len(workout["exercises"]) == 3
+    assert "sets" not in workout["exercises"][0]
+
+
+def test_get_workouts_invalid_cursor():
+    response = client.get("/api/workouts", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.json()["detail"]
+
+
+def test_bulk_import_json_array(data):
+    response = client.post("/api/workouts/bulk", json=[data["workout"]] * 3)
+    assert response.status_code == 200
+
+    result = response.json()
+    assert result["imported"] == 3
+
+    imported = client.get(f"/api/workouts/{result['workout_ids'][0]}").json()
+    assert len(imported["exercises"]) == 3
+    assert imported["exercises"][0]["sets"][0]["subsets"][0]["weight"] == 80.0
+
+
+def test_bulk_import_ndjson(data):
+    body = "\n".join(json.dumps(data["workout"]) for _ in range(2)) + "\n"
+    response = client.post("/api/workouts/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()["imported"] == 2
+
+    assert len(client.get("/api/workouts", params={"user_id": 1}).json()) == 2
+
+
+def test_bulk_import_invalid_line_imports_nothing(data):
+    body = json.dumps(data["workout"]) + "\n" + json.dumps({"exercises": []}) + "\n"
+    response = client.post("/api/workouts/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 2, "user_id"]
+
+    assert client.get("/api/workouts").json() == []
+
+
+def test_bulk_import_unknown_user_imports_nothing(data):
+    response = client.post("/api/workouts/bulk", json=[data["workout"], {**data["workout"], "user_id": 555}, {**data["workout"], "user_id": 7}])
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Users not found: 7, 555"
+
+    assert client.get("/api/workouts").json() == []
+
+
+def test_export_ndjson_round_trip(data):
+    created = [create_workout(data) for _ in range(2)]
+    client.post(f"/api/exercises", json={"exercise_number": 4, "sets": [], "workout_id": created[1]["id"]})
+
+    response = client.get("/api/users/1/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert exported[0] == client.get(f"/api/workouts/{created[0]['id']}").json()
+    assert len(exported[1]["exercises"]) == 4
+    assert exported[1]["exercises"][3]["sets"] == []
+
+    # Exports can be imported again
+    reimport = client.post("/api/workouts/bulk", content=response.text, headers={"Content-Type": "application/x-ndjson"})
+    assert reimport.json()["imported"] == 2
+
+
+def test_export_csv(data):
+    create_workout(data)
+
+    response = client.get("/api/users/1/export", params={"format": "csv"})
+    assert response.status_code == 200
+
+    rows = response.text.splitlines()
+    assert rows[0].startswith("workout_id,user_id,exercise_id")
+    subsets = sum(len(s["subsets"]) for e in data["workout"]["exercises"] for s in e["sets"])
+    assert len(rows) == subsets + 1
+
+
+def test_export_unknown_user():
+    response = client.get("/api/users/999/export")
+    assert response.status_code == 404
+
+
+def test_workout_cache_invalidated_by_child_create(data):
+    workout_data = create_workout(data)
+    workout_id = workout_data["id"]
+    set_id = workout_data["exercises"][0]["sets"][0]["id"]
+
+    first = client.get(f"/api/workouts/{workout_id}").json()
+    hits = client.get("/cache/stats").json()["hits"]
+    assert client.get(f"/api/workouts/{workout_id}").json() == first
+    assert client.get("/cache/stats").json()["hits"] == hits + 1
+
+    client.post("/api/subsets", json={"reps": 5, "weight": 100.0, "subset_number": 2, "set_id": set_id})
+
+    updated = client.get(f"/api/workouts/{workout_id}").json()
+    assert len(updated["exercises"][0]["sets"][0]["subsets"]) == 2
+
+
+def test_workout_conditional_get(data):
+    workout_data = create_workout(data)
+    workout_id = workout_data["id"]
+    exercise_id = workout_data["exercises"][0]["id"]
+
+    first = client.get(f"/api/workouts/{workout_id}")
+    etag = first.headers["ETag"]
+
+    not_modified = client.get(f"/api/workouts/{workout_id}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+
+    # A set created further down the tree changes the workout's version
+    client.post("/api/sets", json={**data["workout"]["exercises"][0]["sets"][0], "exercise_id": exercise_id})
+
+    modified = client.get(f"/api/workouts/{workout_id}", headers={"If-None-Match": etag})
+    assert modified.status_code == 200
+    assert modified.headers["ETag"] != etag
+    assert len(modified.json()["exercises"][0]["sets"]) == 4
+
+
+def test_workout_etag_shared_across_workers(data):
+    workout_id = create_workout(data)["id"]
+    etag = client.get(f"/api/workouts/{workout_id}").headers["ETag"]
+
+    # Another worker, or a restart, has an empty cache and loads the tree itself
+    response_cache.clear()
+    assert client.get(f"/api/workouts/{workout_id}", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_update_subset(data):
+    workout_data = create_workout(data)
+    workout_id = workout_data["id"]
+    subset = workout_data["exercises"][0]["sets"][2]["subsets"][0]
+    etag = client.get(f"/api/workouts/{workout_id}").headers["ETag"]
+
+    with subscribe_and_listen("users:1") as user, subscribe_and_listen(f"workouts:{workout_id}") as ws:
+        response = client.patch(f"/api/subsets/{subset['id']}", json={"weight": 120.0})
+        assert response.status_code == 200
+        assert response.json() == {**subset, "weight": 120.0}
+
+        event = ws.receive_json()
+        assert event["type"] == "subset_updated"
+        assert event["data"]["weight"] == 120.0
+
+        assert user.receive_json()["type"] == "subset_updated"
+        record = user.receive_json()
+        assert record["type"] == "personal_record"
+        assert record["data"]["top_weight"] == 120.0
+
+    # Cached tree and ETag moved on
+    refreshed = client.get(f"/api/workouts/{workout_id}", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.json()["exercises"][0]["sets"][2]["subsets"][0]["weight"] == 120.0
+
+    stats = client.get("/api/users/1/stats").json()
+    rebuild(engine)
+    assert client.get("/api/users/1/stats").json() == stats
+    assert {r["exercise_name"]: r["top_weight"] for r in stats["records"]}["Bench Press"] == 120.0
+
+
+def test_update_lowers_record(data):
+    subset = create_workout(data)["exercises"][0]["sets"][2]["subsets"][0]
+    client.patch(f"/api/subsets/{subset['id']}", json={"weight": 50.0})
+
+    stats = client.get("/api/users/1/stats").json()
+    assert {r["exercise_name"]: r["top_weight"] for r in stats["records"]}["Bench Press"] == 85.0
+    rebuild(engine)
+    assert client.get("/api/users/1/stats").json() == stats
+
+
+def test_move_set_to_another_exercise(data):
+    first, second = create_workout(data), create_workout(data)
+    moved = first["exercises"][0]["sets"][0]
+    target = second["exercises"][1]
+    client.get(f"/api/workouts/{first['id']}")
+    client.get(f"/api/workouts/{second['id']}")
+
+    with subscribe_and_listen(f"workouts:{first['id']}") as old, subscribe_and_listen(f"workouts:{second['id']}") as new:
+        response = client.patch(f"/api/sets/{moved['id']}", json={"exercise_id": target["id"], "exercise_name": "Incline Press"})
+        assert response.status_code == 200
+        assert response.json() == {"id": moved["id"], "exercise_id": target["id"], "exercise_name": "Incline Press", "set_number": 1}
+        assert old.receive_json()["type"] == "set_updated"
+        assert new.receive_json()["type"] == "set_updated"
+
+    old_sets = client.get(f"/api/workouts/{first['id']}").json()["exercises"][0]["sets"]
+    new_sets = client.get(f"/api/workouts/{second['id']}").json()["exercises"][1]["sets"]
+    assert moved["id"] not in [s["id"] for s in old_sets]
+    assert moved["id"] in [s["id"] for s in new_sets]
+
+    # Later events follow the set to its new parents
+    with subscribe_and_listen(f"workouts:{second['id']}") as ws:
+        client.post("/api/subsets", json={"reps": 1, "weight": 10.0, "subset_number": 2, "set_id": moved["id"]})
+        assert ws.receive_json()["type"] == "subset_created"
+
+    stats = client.get("/api/users/1/stats").json()
+    rebuild(engine)
+    assert client.get("/api/users/1/stats").json() == stats
+
+
+def test_delete_workout_cascades(data):
+    workout_data = create_workout(data)
+    workout_id = workout_data["id"]
+    exercise = workout_data["exercises"][0]
+    set_id = exercise["sets"][0]["id"]
+    subset_id = exercise["sets"][0]["subsets"][0]["id"]
+    client.get(f"/api/workouts/{workout_id}")
+    client.get(f"/api/sets/{set_id}")
+
+    with subscribe_and_listen(f"sets:{set_id}") as ws:
+        assert client.delete(f"/api/workouts/{workout_id}").status_code == 204
+        event = ws.receive_json()
+        assert event["type"] == "workout_deleted"
+        assert event["data"] == {"id": workout_id, "user_id": 1}
+
+    assert client.get(f"/api/workouts/{workout_id}").status_code == 404
+    assert client.get(f"/api/exercises/{exercise['id']}").status_code == 404
+    assert client.get(f"/api/sets/{set_id}").status_code == 404
+    assert client.get(f"/api/subsets/{subset_id}").status_code == 404
+
+    stats = client.get("/api/users/1/stats").json()
+    assert stats == {"user_id": 1, "workouts": 0, "exercises": 0, "sets": 0, "subsets": 0, "reps": 0, "volume": 0.0, "records": []}
+
+
+def test_delete_set_keeps_siblings(data):
+    workout_data = create_workout(data)
+    exercise = workout_data["exercises"][0]
+    heaviest = exercise["sets"][2]
+
+    with subscribe_and_listen(f"exercises:{exercise['id']}") as ws:
+        assert client.delete(f"/api/sets/{heaviest['id']}").status_code == 204
+        assert ws.receive_json()["data"] == {"id": heaviest["id"], "exercise_id": exercise["id"]}
+
+    sets = client.get(f"/api/exercises/{exercise['id']}").json()["sets"]
+    assert [s["id"] for s in sets] == [s["id"] for s in exercise["sets"][:2]]
+
+    stats = client.get("/api/users/1/stats").json()
+    assert {r["exercise_name"]: r["top_weight"] for r in stats["records"]}["Bench Press"] == 85.0
+    rebuild(engine)
+    assert client.get("/api/users/1/stats").json() == stats
+
+
+def test_update_and_delete_errors(data):
+    workout_data = create_workout(data)
+    set_id = workout_data["exercises"][0]["sets"][0]["id"]
+
+    assert client.patch("/api/subsets/999", json={"reps": 1}).status_code == 404
+    assert client.delete("/api/exercises/999").status_code == 404
+    assert client.patch(f"/api/sets/{set_id}", json={}).status_code == 422
+    response = client.patch(f"/api/sets/{set_id}", json={"exercise_id": 999})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Exercise not found"
+
+    assert client.delete(f"/api/sets/{set_id}").status_code == 204
+    assert client.delete(f"/api/sets/{set_id}").status_code == 404
+
+
+def test_create_subsets_batch(data):
+    workout_data = create_workout(data)
+    workout_id = workout_data["id"]
+    first, second = [s["id"] for s in workout_data["exercises"][0]["sets"][:2]]
+    client.get(f"/api/workouts/{workout_id}")
+    batch = [
+        {"set_id": first, "reps": 8, "weight": 100.0, "subset_number": 2},
+        {"set_id": first, "reps": 6, "weight": 90.0, "subset_number": 3},
+        {"set_id": second, "reps": 4, "weight": 80.0, "subset_number": 2},
+    ]
+
+    with subscribe_and_listen(f"workouts:{workout_id}") as ws, subscribe_and_listen(f"sets:{second}") as set_ws:
+        response = client.post("/api/subsets/batch", json=batch)
+        assert response.status_code == 200
+        created = response.json()
+        assert [{k: v for k, v in s.items() if k != "id"} for s in created] == batch
+
+        # One event per resource, listing every subset
+        event = ws.receive_json()
+        assert event["type"] == "subsets_created"
+        assert event["data"] == created
+        assert set_ws.receive_json()["data"] == created
+
+    sets = client.get(f"/api/workouts/{workout_id}").json()["exercises"][0]["sets"]
+    assert len(sets[0]["subsets"]) == 3
+    assert len(sets[1]["subsets"]) == 2
+
+    stats = client.get("/api/users/1/stats").json()
+    assert {r["exercise_name"]: r["top_weight"] for r in stats["records"]}["Bench Press"] == 100.0
+    rebuild(engine)
+    assert client.get("/api/users/1/stats").json() == stats
+
+
+def test_create_subsets_batch_unknown_set_creates_nothing(data):
+    set_id = create_workout(data)["exercises"][0]["sets"][0]["id"]
+    batch = [
+        {"set_id": set_id, "reps": 8, "weight": 100.0, "subset_number": 2},
+        {"set_id": 999, "reps": 6, "weight": 90.0, "subset_number": 1},
+    ]
+
+    response = client.post("/api/subsets/batch", json=batch)
+    assert response.status_code == 404
+    assert len(client.get(f"/api/sets/{set_id}").json()["subsets"]) == 1
+    assert client.post("/api/subsets/batch", json=[]).status_code == 422
@@ -1,2 +1,22 @@
-from .websocket_manager import WebSocketManager
-websocket_manager = WebSocketManager()
+from .websocket_manager import WebSocketManager, encode_event, event_seq, event_type, with_resource
+from .backends import BroadcastBackend, LocalBackend, PostgresBackend
+from .history import EventHistory
+import os
+
+def create_backend() -> BroadcastBackend:
+    # WS_BACKEND=postgres fans broadcasts out to every worker and container sharing the database
+    if os.getenv("WS_BACKEND", "local") == "postgres":
+        url = os.getenv("WS_BACKEND_URL") or os.getenv("DATABASE_URL", "")
+        scheme, rest = url.split("://", 1)
+        return PostgresBackend(dsn=f"{scheme.split('+')[0]}://{rest}")
+    return LocalBackend()
+
+websocket_manager = WebSocketManager(
+    max_queue=int(os.getenv("WS_SEND_QUEUE_SIZE", "256")),
+    overflow_policy=os.getenv("WS_OVERFLOW_POLICY", "drop_oldest"),
+    backend=create_backend(),
+    history=EventHistory(
+        max_events=int(os.getenv("WS_HISTORY_SIZE", "100")),
+        max_resources=int(os.getenv("WS_HISTORY_RESOURCES", "10000")),
+    ),
+)
@@ -0,0 +1,219 @@
+from typing import Callable, Dict, List, Tuple
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[List[str], str], None] # (resources, encoded payload)
+
+class BroadcastBackend:
+    """
+    Carries encoded events to every API process. Each WebSocketManager attaches a
+    deliver callback that fans the event out to its own sockets.
+    """
+    def attach(self, deliver: Deliver) -> None:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, resources: List[str], payload: str) -> None:
+        raise NotImplementedError
+
+
+class LocalBackend(BroadcastBackend):
+    """
+    Delivers within the current process. Managers sharing one instance behave like
+    separate workers on a shared bus, which is how the cross-worker path is tested.
+    """
+    def __init__(self):
+        self.listeners: List[Deliver] = []
+
+    def attach(self, deliver: Deliver) -> None:
+        self.listeners.append(deliver)
+
+    async def publish(self, resources: List[str], payload: str) -> None:
+        for deliver in list(self.listeners):
+            deliver(resources, payload)
+
+
+class PostgresBackend(BroadcastBackend):
+    """
+    Postgres LISTEN/NOTIFY. Every process listens on the same channel, including the
+    publisher, so all workers deliver events in the same (commit) order.
+
+    NOTIFY payloads are limited to 8000 bytes, larger events are split into chunks
+    tagged with a message id and reassembled by the listeners.
+    """
+    CHUNK_BYTES = 7000
+
+    def __init__(self, dsn: str, channel: str = "ws_broadcast", max_backoff: float = 30.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.max_backoff = max_backoff
+        self.listeners: List[Deliver] = []
+        self.partial: Dict[str, Dict[int, str]] = {}
+
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.publisher = None
+        self.publish_lock = threading.Lock()
+        self.publisher_retry_at = 0.0
+        self.publisher_backoff = 0.0
+        self.listener = None
+        self.listener_thread: threading.Thread | None = None
+        self.stopping = threading.Event()
+
+        self.reconnects = 0
+
+    def attach(self, deliver: Deliver) -> None:
+        self.listeners.append(deliver)
+
+    async def start(self) -> None:
+        # The first connections are made here so a bad DSN fails startup, later drops are reconnected
+        self.loop = asyncio.get_running_loop()
+        self.stopping.clear()
+
+        self.listener = await asyncio.to_thread(self._connect_listener)
+        self.publisher = await asyncio.to_thread(self._connect)
+
+        self.listener_thread = threading.Thread(target=self._listen, daemon=True)
+        self.listener_thread.start()
+
+    async def stop(self) -> None:
+        self.stopping.set()
+        if self.listener_thread is not None:
+            await asyncio.to_thread(self.listener_thread.join)
+            self.listener_thread = None
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+
+    def _connect(self):
+        import psycopg2
+
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def _connect_listener(self):
+        connection = self._connect()
+        connection.cursor().execute(f'LISTEN "{self.channel}"')
+        return connection
+
+    async def publish(self, resources: List[str], payload: str) -> None:
+        message = f"{json.dumps(resources, separators=(',', ':'))}\n{payload}"
+        await asyncio.to_thread(self._notify, split_utf8(message, self.CHUNK_BYTES))
+
+    def _notify(self, chunks: List[str]) -> None:
+        import psycopg2
+
+        if self.loop is None:
+            raise RuntimeError("PostgresBackend is not started")
+
+        message_id = uuid.uuid4().hex
+        with self.publish_lock:
+            # A dropped publisher is replaced on the next publish, at most once per backoff interval
+            if self.publisher is None or self.publisher.closed:
+                if time.monotonic() < self.publisher_retry_at:
+                    raise ConnectionError("Broadcast publisher is reconnecting")
+                try:
+                    self.publisher = self._connect()
+                    self.reconnects += 1
+                except psycopg2.Error:
+                    self.publisher_backoff = min(max(self.publisher_backoff * 2, 0.5), self.max_backoff)
+                    self.publisher_retry_at = time.monotonic() + self.publisher_backoff
+                    raise
+                self.publisher_backoff = 0.0
+
+            try:
+                with self.publisher.cursor() as cursor:
+                    # One transaction, so a multi-chunk event is delivered atomically
+                    cursor.execute("BEGIN")
+                    for index, chunk in enumerate(chunks):
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, f"{message_id} {index} {len(chunks)}\n{chunk}"))
+                    cursor.execute("COMMIT")
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.publisher.close()
+                raise
+
+    def _listen(self) -> None:
+        import psycopg2
+
+        backoff = 0.0
+        while not self.stopping.is_set():
+            if self.listener is None:
+                try:
+                    self.listener = self._connect_listener()
+                    self.reconnects += 1
+                    backoff = 0.0
+                    logger.info("Broadcast listener reconnected")
+                except psycopg2.Error:
+                    backoff = min(max(backoff * 2, 0.5), self.max_backoff)
+                    logger.warning("Broadcast listener reconnect failed, retrying in %.1fs", backoff)
+                    self.stopping.wait(backoff)
+                    continue
+
+            try:
+                self._poll(self.listener)
+            except (psycopg2.Error, OSError, ValueError):
+                # Events sent while disconnected are lost here, clients catch up through the change log
+                logger.warning("Broadcast listener connection lost", exc_info=True)
+                self.listener.close()
+                self.listener = None
+                self.partial.clear()
+
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def _poll(self, connection) -> None:
+        while not self.stopping.is_set():
+            if select.select([connection], [], [], 0.5) == ([], [], []):
+                continue
+
+            connection.poll()
+            while connection.notifies:
+                event = self._reassemble(connection.notifies.pop(0).payload)
+                if event is not None and self.loop is not None:
+                    self.loop.call_soon_threadsafe(self._deliver, *event)
+
+    def _reassemble(self, notification: str) -> Tuple[List[str], str] | None:
+        header, chunk = notification.split("\n", 1)
+        message_id, index, total = header.split(" ")
+
+        if total != "1":
+            chunks = self.partial.setdefault(message_id, {})
+            chunks[int(index)] = chunk
+            if len(chunks) < int(total):
+                return None
+            chunks = self.partial.pop(message_id)
+            chunk = "".join(chunks[i] for i in range(int(total)))
+
+        resources, payload = chunk.split("\n", 1)
+        return json.loads(resources), payload
+
+    def _deliver(self, resources: List[str], payload: str) -> None:
+        for deliver in list(self.listeners):
+            deliver(resources, payload)
+
+
+def split_utf8(text: str, limit: int) -> List[str]:
+    data = text.encode()
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Never cut inside a multi-byte character
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        chunks.append(data[start:end].decode())
+        start = end
+    return chunks
@@ -0,0 +1,162 @@
+from fastapi import WebSocket
+from typing import Any, Awaitable, Callable, Deque, Dict, List
+from collections import deque
+import asyncio
+import json
+import time
+
+OVERFLOW_POLICIES = ("drop_oldest", "disconnect")
+
+# A coalescing window is flushed early once it holds this many events
+MAX_BATCH = 100
+
+class Connection:
+    """
+    Outbound side of a single websocket: a bounded queue drained by its own task,
+    so a slow client only ever delays itself.
+
+    All queue operations run on the event loop the websocket was accepted on;
+    offer() can be called from any thread.
+    """
+    def __init__(
+        self,
+        websocket: WebSocket,
+        on_failure: Callable[[WebSocket], Awaitable[None]],
+        max_queue: int,
+        overflow_policy: str,
+        on_sent: Callable[[float], None] | None = None,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.websocket = websocket
+        self.on_failure = on_failure
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.on_sent = on_sent # called with the seconds each send took
+
+        self.loop = asyncio.get_running_loop()
+        self.queue: Deque[str] = deque()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.sent = 0
+        self.coalesced = 0 # events that went out inside a batch instead of their own frame
+        self.closed = False
+
+        # Per resource coalescing: events are held for the window after the first one, then sent as one batch
+        self.windows: Dict[str, float] = {}
+        self.pending: Dict[str, List[str]] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.task = self.loop.create_task(self._drain())
+
+    def _on_loop(self, callback: Callable[..., None], *args: Any) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def offer(self, frame: str) -> None:
+        self._on_loop(self._enqueue, frame)
+
+    def offer_event(self, resource: str, frame: str) -> None:
+        self._on_loop(self._enqueue_event, resource, frame)
+
+    def coalesce(self, resource: str, window: float) -> None:
+        """Hold events on resource for window seconds and send them as one batch. 0 sends them as they come"""
+        self._on_loop(self._set_window, resource, window)
+
+    def close(self) -> None:
+        self._on_loop(self._close)
+
+    def _enqueue(self, frame: str) -> None:
+        if self.closed:
+            return
+
+        if len(self.queue) >= self.max_queue:
+            if self.overflow_policy == "disconnect":
+                self.dropped += len(self.queue) + 1
+                self.queue.clear()
+                self.closed = True
+                self.loop.create_task(self._evict())
+                return
+
+            self.queue.popleft()
+            self.dropped += 1
+
+        self.queue.append(frame)
+        self.ready.set()
+
+    def _set_window(self, resource: str, window: float) -> None:
+        self._flush(resource)
+        if window > 0:
+            self.windows[resource] = window
+        else:
+            self.windows.pop(resource, None)
+
+    def _enqueue_event(self, resource: str, frame: str) -> None:
+        window = self.windows.get(resource)
+        if window is None or self.closed:
+            self._enqueue(frame)
+            return
+
+        pending = self.pending.setdefault(resource, [])
+        pending.append(frame)
+        # The window opens with the first event and is not extended, a steady stream still goes out
+        if len(pending) == 1:
+            self.timers[resource] = self.loop.call_later(window, self._flush, resource)
+        elif len(pending) >= MAX_BATCH:
+            self._flush(resource)
+
+    def _flush(self, resource: str) -> None:
+        timer = self.timers.pop(resource, None)
+        if timer is not None:
+            timer.cancel()
+        frames = self.pending.pop(resource, None)
+        if not frames:
+            return
+        if len(frames) == 1:
+            self._enqueue(frames[0])
+            return
+        self.coalesced += len(frames)
+        self._enqueue(f'{{"type":"batch","resource":{json.dumps(resource)},"events":[{",".join(frames)}]}}')
+
+    async def _drain(self) -> None:
+        while True:
+            if not self.queue:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            frame = self.queue.popleft()
+            started = time.perf_counter()
+            try:
+                await self.websocket.send_text(frame)
+                self.sent += 1
+            except Exception:
+                await self.on_failure(self.websocket)
+                return
+            if self.on_sent is not None:
+                self.on_sent(time.perf_counter() - started)
+
+    async def _evict(self) -> None:
+        # 1013: try again later, the client is expected to reconnect and resync
+        try:
+            await self.websocket.close(code=1013)
+        except Exception:
+            pass
+        await self.on_failure(self.websocket)
+
+    def _close(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        self.pending.clear()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
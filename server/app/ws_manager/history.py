@@ -0,0 +1,80 @@
+from typing import Deque, Iterable, List, Tuple
+from collections import OrderedDict, deque
+import bisect
+
+class ResourceBuffer:
+    __slots__ = ("events", "complete_after")
+
+    def __init__(self, max_events: int, complete_after: int):
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=max_events)
+        # Every event on the resource with a higher seq than this is (or was) in the buffer
+        self.complete_after = complete_after
+
+
+class EventHistory:
+    """
+    The last max_events (seq, payload) pairs per resource, for catching up reconnecting clients.
+    Only the max_resources most recently written resources are kept.
+
+    since() answers None when the history can't prove it holds every event after the given
+    sequence number: events were dropped, or happened before this process saw its first one.
+    """
+    def __init__(self, max_events: int = 100, max_resources: int = 10_000):
+        self.max_events = max_events
+        self.max_resources = max_resources
+        self.buffers: OrderedDict[str, ResourceBuffer] = OrderedDict()
+        self.clear()
+
+    def clear(self) -> None:
+        self.buffers.clear()
+        self.start: int | None = None  # seq before the first event seen
+        self.evicted_floor = 0         # highest seq of any evicted buffer
+
+    def record(self, resources: Iterable[str], seq: int, payload: str) -> None:
+        if self.start is None:
+            self.start = seq - 1
+
+        for resource in resources:
+            buffer = self.buffers.get(resource)
+            if buffer is None:
+                buffer = self.buffers[resource] = ResourceBuffer(self.max_events, self.floor)
+            self.buffers.move_to_end(resource)
+            self._insert(buffer, seq, payload)
+
+        while len(self.buffers) > self.max_resources:
+            _, evicted = self.buffers.popitem(last=False)
+            if evicted.events:
+                self.evicted_floor = max(self.evicted_floor, evicted.events[-1][0])
+
+    def _insert(self, buffer: ResourceBuffer, seq: int, payload: str) -> None:
+        events = buffer.events
+        # Commits are ordered by seq but deliveries from different workers can overtake each other
+        if not events or events[-1][0] < seq:
+            if len(events) == events.maxlen:
+                buffer.complete_after = max(buffer.complete_after, events[0][0])
+            events.append((seq, payload))
+            return
+
+        entries = list(events)
+        position = bisect.bisect_left(entries, seq, key=lambda entry: entry[0])
+        if position < len(entries) and entries[position][0] == seq:
+            return
+        entries.insert(position, (seq, payload))
+        if len(entries) > self.max_events:
+            buffer.complete_after = max(buffer.complete_after, entries[0][0])
+        events.clear()
+        events.extend(entries[-self.max_events:])
+
+    @property
+    def floor(self) -> int:
+        return max(self.start or 0, self.evicted_floor)
+
+    def since(self, resource: str, seq: int) -> List[Tuple[int, str]] | None:
+        if self.start is None:
+            return None
+        buffer = self.buffers.get(resource)
+        if buffer is None:
+            return [] if seq >= self.floor else None
+        if seq < buffer.complete_after:
+            return None
+        return [entry for entry in buffer.events if entry[0] > seq]
@@ -1,32 +1,140 @@
 from fastapi import WebSocket
-from typing import List, Dict
+from pydantic import BaseModel
+from typing import Any, Callable, Dict, List, Set
+from .connection import Connection
+from .backends import BroadcastBackend, LocalBackend
+from .history import EventHistory
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+def encode_event(event_type: str, data: BaseModel | Any, seq: int | None = None) -> str:
+    """Encode an event once; the result is shared by every resource and subscriber"""
+    encoded = data.model_dump_json() if isinstance(data, BaseModel) else json.dumps(data, separators=(",", ":"))
+    if seq is None:
+        return f'{{"type":{json.dumps(event_type)},"data":{encoded}}}'
+    return f'{{"type":{json.dumps(event_type)},"seq":{seq},"data":{encoded}}}'
+
+# Matches the prefix written by encode_event, so the sequence number is read without decoding the payload
+SEQ_PREFIX = re.compile(r'\{"type":"(?:[^"\\]|\\.)*","seq":(\d+),')
+
+def event_seq(payload: str) -> int | None:
+    match = SEQ_PREFIX.match(payload)
+    return int(match.group(1)) if match else None
+
+TYPE_PREFIX = re.compile(r'\{"type":"((?:[^"\\]|\\.)*)"')
+
+def event_type(payload: str) -> str | None:
+    match = TYPE_PREFIX.match(payload)
+    return match.group(1) if match else None
+
+def with_resource(payload: str, resource: str) -> str:
+    # Splice the resource tag into an encoded object instead of decoding and re-encoding it
+    return f'{payload[:-1]},"resource":{json.dumps(resource)}}}'
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.subscriptions: Dict[WebSocket, List[str]] = {}
+    def __init__(
+        self,
+        max_queue: int = 256,
+        overflow_policy: str = "drop_oldest",
+        backend: BroadcastBackend | None = None,
+        history: EventHistory | None = None,
+    ):
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+
+        # Recent sequenced events per resource, kept for clients catching up after a reconnect
+        self.history = history if history is not None else EventHistory()
+
+        self.backend = backend if backend is not None else LocalBackend()
+        self.backend.attach(self.deliver)
+
+        # Called with (resources, payload) for every event, including those published by other workers
+        self.listeners: List[Callable[[List[str], str], None]] = []
+        # Called with the seconds each frame took to write
+        self.on_sent: Callable[[float], None] | None = None
+
+        self.active_connections: Dict[WebSocket, Connection] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {} # websocket -> resources
+        self.subscribers: Dict[str, Set[WebSocket]] = {}   # resource -> websockets
+
+        # Totals for connections that are already gone
+        self.sent_closed = 0
+        self.dropped_closed = 0
+        self.coalesced_closed = 0
+        self.evicted = 0
+        self.publish_failures = 0
+        self.events = 0
+        self.fanout = 0 # frames queued by deliver, over all events
+
+    async def start(self) -> None:
+        await self.backend.start()
+
+    async def stop(self) -> None:
+        await self.backend.stop()
 
     async def connect(self, websocket: WebSocket) -> None:
         try:
             await websocket.accept()
-            self.active_connections.append(websocket)
-            self.subscriptions[websocket] = []
+            self.active_connections[websocket] = Connection(
+                websocket=websocket,
+                on_failure=self.disconnect,
+                max_queue=self.max_queue,
+                overflow_policy=self.overflow_policy,
+                on_sent=self.on_sent,
+            )
+            self.subscriptions[websocket] = set()
         except Exception:
             raise
 
     async def disconnect(self, websocket: WebSocket) -> None:
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        connection = self.active_connections.pop(websocket, None)
+        if connection is not None:
+            connection.close()
+            self.sent_closed += connection.sent
+            self.dropped_closed += connection.dropped
+            self.coalesced_closed += connection.coalesced
+            if connection.overflow_policy == "disconnect" and connection.dropped:
+                self.evicted += 1
 
-        if websocket in self.subscriptions:
-            del self.subscriptions[websocket]
+        for resource in self.subscriptions.pop(websocket, ()):
+            self._remove_subscriber(resource, websocket)
 
-    def subscribe(self, websocket: WebSocket, resource: str) -> None:
-        if websocket not in self.active_connections:
+    def subscribe(self, websocket: WebSocket, resource: str, since: int | None = None, coalesce_ms: int = 0) -> int | None:
+        """
+        With since, events on the resource after that sequence number are queued from the history
+        before live delivery starts. Returns how many were replayed, or None if the history no longer
+        reaches back that far (the client then catches up through GET /changes).
+
+        With coalesce_ms, live events arriving within that many milliseconds of each other are sent
+        as a single {"type":"batch","resource":...,"events":[...]} frame.
+        """
+        connection = self.active_connections.get(websocket)
+        if connection is None:
             raise ValueError(f"Connection not active: {websocket}")
 
-        if resource not in self.subscriptions[websocket]:
-            self.subscriptions[websocket].append(resource)
+        # Nothing awaits between the replay and registering, so no live event can fall in between
+        # or overtake it. The frames only go on this connection's queue, other sockets aren't held up
+        replayed = None
+        if since is not None:
+            events = self.history.since(resource, since)
+            if events is not None and len(events) < self.max_queue:
+                for _, payload in events:
+                    connection.offer(with_resource(payload, resource))
+                replayed = len(events)
+
+        connection.coalesce(resource, coalesce_ms / 1000)
+        self.subscriptions[websocket].add(resource)
+        self.subscribers.setdefault(resource, set()).add(websocket)
+        return replayed
+
+    def send(self, websocket: WebSocket, data: Dict | str) -> None:
+        # Queued behind anything already offered to this socket
+        connection = self.active_connections.get(websocket)
+        if connection is not None:
+            connection.offer(data if isinstance(data, str) else json.dumps(data, separators=(",", ":")))
 
     def unsubscribe(self, websocket: WebSocket, resource: str) -> None:
         if websocket not in self.active_connections:
@@ -36,19 +144,67 @@ class WebSocketManager:
             raise ValueError(f"Websocket is not subscribed to resource: {resource}")
 
         self.subscriptions[websocket].remove(resource)
+        self._remove_subscriber(resource, websocket)
+        # Events held for the resource happened while subscribed, they still go out
+        self.active_connections[websocket].coalesce(resource, 0)
+
+    def _remove_subscriber(self, resource: str, websocket: WebSocket) -> None:
+        subscribers = self.subscribers.get(resource)
+        if subscribers is None:
+            return
+
+        subscribers.discard(websocket)
+        if not subscribers:
+            del self.subscribers[resource]
+
+    async def broadcast(self, resource: str, data: Dict | str):
+        await self.broadcast_many(resources=[resource], data=data)
+
+    async def broadcast_many(self, resources: List[str], data: Dict | str):
+        # Goes through the backend so sockets held by other workers receive it too
+        payload = data if isinstance(data, str) else json.dumps(data, separators=(",", ":"))
+        try:
+            await self.backend.publish(resources, payload)
+        except Exception:
+            # Callers broadcast after commit: failing the request would invite a duplicate retry.
+            # Subscribers that missed the event catch up from the change log
+            self.publish_failures += 1
+            logger.exception("Broadcast publish failed for %s", resources)
+
+    def add_listener(self, listener: Callable[[List[str], str], None]) -> None:
+        self.listeners.append(listener)
+
+    def deliver(self, resources: List[str], payload: str) -> None:
+        for listener in self.listeners:
+            listener(resources, payload)
+
+        seq = event_seq(payload)
+        if seq is not None:
+            self.history.record(resources, seq, payload)
+
+        # Only enqueues, each connection's own task does the sending
+        self.events += 1
+        for resource in resources:
+            frame = with_resource(payload, resource)
+            for ws in list(self.subscribers.get(resource, ())):
+                connection = self.active_connections.get(ws)
+                if connection is not None:
+                    connection.offer_event(resource, frame)
+                    self.fanout += 1
 
-    async def broadcast(self, resource: str, data:Dict, exclude_websocket: WebSocket | None = None):
-        failed_connections = []
-
-        for ws, resources in self.subscriptions.items():
-            if resource in resources and ws is not exclude_websocket:
-                try:
-                    await ws.send_json({**data, "resource": resource})
-                except Exception:
-                    failed_connections.append(ws)
-
-        for ws in failed_connections:
-            try:
-                await self.disconnect(ws)
-            except Exception as e:
-                print(f"WARNING: Unable to close connection: {e}")
+    def stats(self) -> Dict[str, int]:
+        connections = list(self.active_connections.values())
+        return {
+            "connections": len(connections),
+            "subscriptions": sum(len(resources) for resources in self.subscriptions.values()),
+            "queued": sum(len(c.queue) for c in connections),
+            "max_queue_depth": max((len(c.queue) for c in connections), default=0),
+            "sent": self.sent_closed + sum(c.sent for c in connections),
+            "dropped": self.dropped_closed + sum(c.dropped for c in connections),
+            "coalesced": self.coalesced_closed + sum(c.coalesced for c in connections),
+            "evicted": self.evicted,
+            "publish_failures": self.publish_failures,
+            "events": self.events,
+            "fanout": self.fanout,
+            "backend_reconnects": getattr(self.backend, "reconnects", 0),
+        }